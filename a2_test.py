@@ -24,6 +24,12 @@ NOTES:
       you might get inaccurate test failures!
 """
 import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from typing import List
 
 import pytest
 from hypothesis import given
@@ -36,6 +42,18 @@ from tree_data import FileSystemTree
 # You may need to modify this, depending on where you downloaded and
 # extracted the files.
 from tree_data import AbstractTree
+from scanner import (FILE_COUNT, build_flat_tree, build_tree,
+                     flatten_record, make_node, scan_disk_usage,
+                     scan_parallel)
+from async_scanner import AsyncScanner, FileSystemLayer, LatencyLayer
+import instrumentation
+from tree_diff import diff_entries, diff_paths, diff_trees
+from tree_io import (diff_ndjson, iter_du, iter_ndjson, read_du, read_ndjson,
+                     write_ndjson)
+from tree_filter import (FilteredViews, build_type_tree, larger_than,
+                         name_matches)
+from type_index import index_tree, scan_indexed
+from shared_tree import attach_tree, publish_tree
 
 EXAMPLE_PATH = os.path.join('example-data', 'B')
 
@@ -136,6 +154,593 @@ def test_example_data() -> None:
     assert rect_f4 == (0, 750, 800, 250)
 
 
+def test_scan_parallel_matches_serial(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    serial = FileSystemTree(path)
+    parallel = scan_parallel(path, max_workers=2)
+
+    assert _tree_shape(parallel) == _tree_shape(serial)
+    assert parallel.data_size == 40
+    for subtree in parallel._subtrees:
+        assert subtree._parent_tree is parallel
+
+
+def test_scan_parallel_single_file(tmp_path) -> None:
+    path = os.path.join(_make_example_dir(tmp_path), 'f4.txt')
+    tree = scan_parallel(path)
+
+    assert tree._root == 'f4.txt'
+    assert tree._subtrees == []
+    assert tree.data_size == 10
+
+
+def test_flatten_record_round_trip() -> None:
+    record = ('B', 0, [('A', 0, [('f1.txt', 15, None), ('E', 0, [])]),
+                       ('f4.txt', 10, None)])
+    flat = flatten_record(record)
+
+    assert flat == (['f1.txt', 'E', 'A', 'f4.txt', 'B'], [15, 0, 0, 10, 0],
+                    [FILE_COUNT, 0, 2, FILE_COUNT, 2])
+    tree = build_flat_tree(flat)
+    assert _tree_shape(tree) == _tree_shape(build_tree(record))
+    folder_a = tree._subtrees[0]
+    assert folder_a._parent_tree is tree
+    assert folder_a._subtrees[1]._parent_tree is folder_a
+
+
+def test_scan_parallel_deep_folder(tmp_path) -> None:
+    # Deep enough that pickling the nested records or nodes would need more
+    # than the default recursion limit.
+    path = str(tmp_path)
+    for _ in range(250):
+        path = os.path.join(path, 'd')
+    os.makedirs(path)
+    with open(os.path.join(path, 'f.txt'), 'w') as f:
+        f.write('x' * 7)
+    tree = scan_parallel(str(tmp_path), max_workers=1)
+
+    assert tree.data_size == 7
+    assert tree._subtrees[0]._parent_tree is tree
+
+
+def test_scan_disk_usage_counts_hard_links_once(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    os.link(os.path.join(path, 'f4.txt'), os.path.join(path, 'f5.txt'))
+    tree = scan_disk_usage(path)
+    _sort_subtrees(tree)
+
+    f4, f5 = tree._subtrees[1], tree._subtrees[2]
+    assert {f4.data_size, f5.data_size} == {0, os.stat(
+        os.path.join(path, 'f4.txt')).st_blocks * 512}
+
+
+def test_scan_disk_usage_does_not_follow_symlinks(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    os.symlink(path, os.path.join(path, 'A', 'loop'))
+    tree = scan_disk_usage(path)
+    _sort_subtrees(tree)
+
+    loop = tree._subtrees[0]._subtrees[-1]
+    assert loop._root == 'loop'
+    assert loop._subtrees == []
+
+
+def test_scan_disk_usage_sparse_file(tmp_path) -> None:
+    path = str(tmp_path / 'sparse')
+    with open(path, 'wb') as f:
+        f.truncate(10 * 1024 * 1024)
+    tree = scan_disk_usage(path)
+
+    assert tree.data_size == os.stat(path).st_blocks * 512
+    assert tree.data_size < 10 * 1024 * 1024
+
+
+def test_get_child_containing(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    _sort_subtrees(tree)
+    folder_a, f4 = tree._subtrees
+    f1 = folder_a._subtrees[0]
+
+    assert tree.get_child_containing(f1) is folder_a
+    assert tree.get_child_containing(f4) is f4
+    assert folder_a.get_child_containing(f1) is f1
+    assert folder_a.get_child_containing(f4) is None
+
+
+def test_diff_entries_merges_in_post_order() -> None:
+    old = [((), 0, True), (('a',), 0, True), (('a', 'x'), 5, False),
+           (('b',), 3, False)]
+    new = [((), 0, True), (('a',), 0, True), (('a', 'x'), 8, False),
+           (('a', 'y'), 1, False), (('c',), 2, False)]
+
+    assert list(diff_entries(old, new)) == [
+        (('a', 'x'), 5, 8, False), (('a', 'y'), 0, 1, False),
+        (('a',), 5, 9, True), (('b',), 3, 0, False), (('c',), 0, 2, False),
+        ((), 8, 11, True)]
+
+
+def test_diff_trees_sizes_by_growth(tmp_path) -> None:
+    old = FileSystemTree(_make_example_dir(tmp_path / 'old'))
+    new_path = _make_example_dir(tmp_path / 'new')
+    with open(os.path.join(new_path, 'A', 'f1.txt'), 'a') as f:
+        f.write('e' * 5)
+    os.remove(os.path.join(new_path, 'f4.txt'))
+    new = FileSystemTree(new_path)
+
+    diff = diff_trees(old, new)
+    assert (diff.old_size, diff.new_size) == (40, 35)
+    # f1.txt grew by 5 and f4.txt shrank by 10.
+    assert diff.data_size == 15
+    folder_a, f4 = diff._subtrees
+    assert f4._root == 'f4.txt'
+    assert f4.colour[2] == 255
+    # The unchanged f2.txt and f3.txt are left out.
+    assert [t._root for t in folder_a._subtrees] == ['f1.txt']
+    assert folder_a._subtrees[0].colour[0] == 255
+
+    from_disk = diff_paths(os.path.join(str(tmp_path), 'old', 'B'), new_path)
+    assert _tree_shape(from_disk) == _tree_shape(diff)
+
+
+def test_diff_trees_and_paths_agree_on_empty_folders(tmp_path) -> None:
+    old_path = _make_example_dir(tmp_path / 'old')
+    os.mkdir(os.path.join(old_path, 'E'))
+    new_path = _make_example_dir(tmp_path / 'new')
+    os.mkdir(os.path.join(new_path, 'E'))
+    with open(os.path.join(new_path, 'E', 'x'), 'w') as f:
+        f.write('e' * 3)
+
+    for by_growth in [True, False]:
+        from_trees = diff_trees(FileSystemTree(old_path),
+                                FileSystemTree(new_path), by_growth)
+        from_disk = diff_paths(old_path, new_path, by_growth)
+        _sort_subtrees(from_trees)
+        _sort_subtrees(from_disk)
+        assert _tree_shape(from_trees) == _tree_shape(from_disk)
+        folder_e = [t for t in from_trees._subtrees if t._root == 'E'][0]
+        assert [t._root for t in folder_e._subtrees] == ['x']
+
+
+def test_diff_trees_file_replaced_by_folder() -> None:
+    old = make_node('B', [make_node('x', [], 4), make_node('y', [], 3)])
+    new = make_node('B', [make_node('x', [make_node('z', [], 6)]),
+                          make_node('y', [], 3)])
+
+    diff = diff_trees(old, new)
+    assert diff.data_size == 10
+    folder_x, = diff._subtrees
+    assert (folder_x.old_size, folder_x.new_size) == (4, 6)
+    assert sorted((t._root, t.old_size, t.new_size)
+                  for t in folder_x._subtrees) == [('(file)', 4, 0),
+                                                   ('z', 0, 6)]
+
+    by_size = diff_trees(old, new, by_growth=False)
+    assert [t._root for t in by_size._subtrees] == ['x', 'y']
+
+
+def test_ndjson_round_trip(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    _sort_subtrees(tree)
+    lines = list(iter_ndjson(tree))
+
+    assert len(lines) == 6
+    assert _tree_shape(read_ndjson(lines)) == _tree_shape(tree)
+
+
+def test_du_round_trip(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    _sort_subtrees(tree)
+    lines = list(iter_du(tree))
+
+    assert lines[-1] == '40\tB\n'
+    assert lines[:4] == ['15\tB/A/f1.txt\n', '5\tB/A/f2.txt\n',
+                         '10\tB/A/f3.txt\n', '30\tB/A\n']
+    assert _tree_shape(read_du(lines)) == _tree_shape(tree)
+
+
+@pytest.mark.skipif(shutil.which('du') is None, reason='needs du')
+def test_read_real_du_output(tmp_path) -> None:
+    _make_example_dir(tmp_path)
+    (tmp_path / 'B' / 'E').mkdir()
+    output = subprocess.run(['du', '-ab', 'B'], cwd=str(tmp_path),
+                            stdout=subprocess.PIPE, universal_newlines=True,
+                            check=True).stdout
+    sizes = {line.split('\t')[1]: int(line.split('\t')[0])
+             for line in output.splitlines()}
+    tree = read_du(output.splitlines(True))
+    _sort_subtrees(tree)
+
+    folder_a, empty, f4 = tree._subtrees
+    assert _tree_shape(folder_a) == _tree_shape(
+        FileSystemTree(str(tmp_path / 'B' / 'A')))
+    assert f4._root == 'f4.txt' and f4.data_size == 10
+    # The empty folder is read as a file of the size du gives it.
+    assert empty._root == 'E' and empty._subtrees == []
+    assert empty.data_size == sizes['B/E']
+    assert tree.data_size == 40 + sizes['B/E']
+
+
+def test_diff_ndjson_matches_diff_trees(tmp_path) -> None:
+    old = FileSystemTree(_make_example_dir(tmp_path / 'old'))
+    new_path = _make_example_dir(tmp_path / 'new')
+    os.remove(os.path.join(new_path, 'A', 'f2.txt'))
+    new = FileSystemTree(new_path)
+    for name, tree in [('old.ndjson', old), ('new.ndjson', new)]:
+        with open(str(tmp_path / name), 'w') as f:
+            write_ndjson(tree, f)
+
+    diff = diff_ndjson(str(tmp_path / 'old.ndjson'),
+                       str(tmp_path / 'new.ndjson'))
+    assert _tree_shape(diff) == _tree_shape(diff_trees(old, new))
+    assert diff.data_size == 5
+
+
+def test_diff_ndjson_subtree_order(tmp_path) -> None:
+    a, b = make_node('a', [], 4), make_node('b', [], 6)
+    old = make_node('B', [a, b])
+    new = make_node('B', [make_node('b', [], 6), make_node('a', [], 4)])
+    for name, tree, sort in [('old.ndjson', old, True),
+                             ('new.ndjson', new, True),
+                             ('unsorted.ndjson', new, False)]:
+        with open(str(tmp_path / name), 'w') as f:
+            write_ndjson(tree, f, sort=sort)
+
+    diff = diff_ndjson(str(tmp_path / 'old.ndjson'),
+                       str(tmp_path / 'new.ndjson'))
+    assert diff.data_size == 0
+    assert diff._subtrees == []
+    with pytest.raises(ValueError):
+        diff_ndjson(str(tmp_path / 'old.ndjson'),
+                    str(tmp_path / 'unsorted.ndjson'))
+
+
+def test_filtered_view_keeps_matching_leaves(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    (tmp_path / 'B' / 'A' / 'f5.log').write_text('e' * 7)
+    tree = FileSystemTree(path)
+    views = FilteredViews(tree)
+    only_f1 = name_matches('f1.*', '*.log')
+
+    view = views.get_view(only_f1)
+    assert view is views.get_view(only_f1)
+    assert view.data_size == 22
+    assert tree.data_size == 47
+    assert len(view._subtrees) == 1
+    assert view._subtrees[0].source is tree.get_child_containing(
+        view._subtrees[0]._subtrees[0].source)
+
+    rects = view.generate_treemap((0, 0, 800, 1000))
+    assert len(rects) == 2
+    leaf = view.get_info((0, 0, 800, 1000), (1, 1))
+    assert leaf.source._root in ('f1.txt', 'f5.log')
+
+
+def test_filtered_view_with_no_matches(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    view = FilteredViews(tree).get_view(name_matches('*.log'))
+
+    assert view.data_size == 0
+    assert view.generate_treemap((0, 0, 800, 1000)) == []
+
+
+def test_filtered_views_follow_changes(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    _sort_subtrees(tree)
+    views = FilteredViews(tree)
+    big = larger_than(8)
+    view = views.get_view(big)
+    by_type = views.get_view(big, by_type=True)
+    folder_a, f4 = tree._subtrees
+    f1, f2, f3 = folder_a._subtrees
+
+    # Resizing a kept leaf updates the views in place.
+    f3.data_size = 12
+    tree.increase_size(f3, 2)
+    views.resize(f3, 10, 12)
+    assert views.get_view(big) is view
+    assert views.get_view(big, by_type=True) is by_type
+    assert (view.data_size, view._subtrees[0].data_size) == (37, 27)
+    assert by_type.data_size == 37
+
+    # Deleting a leaf removes it, and the folders left empty.
+    views.remove(f4)
+    tree.parent_remove(f4)
+    tree.size_decrease(f4)
+    assert views.get_view(big) is view
+    assert _tree_shape(view) == ('B', 27, [('A', 27, [('f1.txt', 15, []),
+                                                     ('f3.txt', 12, [])])])
+    for leaf in [f1, f3]:
+        views.remove(leaf)
+        tree.parent_remove(leaf)
+        tree.size_decrease(leaf)
+    assert (view.data_size, view._subtrees) == (0, [])
+    assert by_type.data_size == 0
+
+    # A leaf that now passes the filter makes the views be built again.
+    f2.data_size = 9
+    tree.increase_size(f2, 4)
+    views.resize(f2, 5, 9)
+    assert views.get_view(big) is not view
+    assert views.get_view(big).data_size == 9
+    assert views.get_view(big, by_type=True).data_size == 9
+
+
+def test_filtered_views_remove_leaf_with_shared_name() -> None:
+    a1, b1 = make_node('x.py', [], 5), make_node('x.py', [], 7)
+    tree = make_node('R', [make_node('A', [a1]), make_node('B', [b1])])
+    views = FilteredViews(tree)
+    by_type = views.get_view(None, by_type=True)
+
+    views.remove(b1)
+    group, = by_type._subtrees
+    assert [leaf.source for leaf in group._subtrees] == [a1]
+    assert (by_type.data_size, group._subtrees[0].data_size) == (5, 5)
+
+
+def test_async_scanner_matches_serial(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    layer = LatencyLayer(0.05)
+    scanner = AsyncScanner(max_concurrency=8, layer=layer)
+    tree = scanner.scan(path)
+
+    assert _tree_shape(tree) == _tree_shape(FileSystemTree(path))
+    assert scanner.timed_out == []
+    # f4.txt and A are looked at together, then A's three files.
+    assert layer.max_in_flight >= 2
+
+
+def test_async_scanner_timeout(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    scanner = AsyncScanner(timeout=0.01, layer=LatencyLayer(0.1))
+    tree = scanner.scan(path)
+
+    assert scanner.timed_out == [path]
+    assert tree.data_size == 0
+
+
+class _HangingLayer(FileSystemLayer):
+    """A FileSystemLayer whose stat hangs for one path."""
+
+    def __init__(self, hanging_path: str, delay: float) -> None:
+        self.hanging_path = hanging_path
+        self.delay = delay
+
+    def stat(self, path: str) -> os.stat_result:
+        if path == self.hanging_path:
+            time.sleep(self.delay)
+        return FileSystemLayer.stat(self, path)
+
+
+def test_async_scanner_timeout_does_not_block_others(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    f2 = os.path.join(path, 'A', 'f2.txt')
+    scanner = AsyncScanner(max_concurrency=1, timeout=0.3,
+                           layer=_HangingLayer(f2, 1))
+    tree = scanner.scan(path)
+
+    assert scanner.timed_out == [f2]
+    assert tree.data_size == 35
+
+
+class _BlockedLayer(FileSystemLayer):
+    """A FileSystemLayer whose stat blocks for some paths until released."""
+
+    def __init__(self, blocked_paths: List[str]) -> None:
+        self.blocked_paths = blocked_paths
+        self.released = threading.Event()
+
+    def stat(self, path: str) -> os.stat_result:
+        if path in self.blocked_paths:
+            self.released.wait()
+        return FileSystemLayer.stat(self, path)
+
+
+def test_async_scanner_more_hung_calls_than_concurrency(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    hung = [os.path.join(path, 'A', name)
+            for name in ['f1.txt', 'f2.txt', 'f3.txt']]
+    layer = _BlockedLayer(hung)
+    try:
+        scanner = AsyncScanner(max_concurrency=2, timeout=0.2, layer=layer)
+        tree = scanner.scan(path)
+        assert sorted(scanner.timed_out) == hung
+        assert tree.data_size == 10
+
+        # With no calls abandoned, the hung calls keep their places, and the
+        # calls waiting for one time out instead.
+        scanner = AsyncScanner(max_concurrency=2, timeout=0.2, layer=layer,
+                               max_abandoned=0)
+        start = time.perf_counter()
+        tree = scanner.scan(path)
+        assert time.perf_counter() - start < 5
+        assert set(hung[:2]) <= set(scanner.timed_out)
+    finally:
+        layer.released.set()
+
+
+def test_scan_indexed_totals(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    (tmp_path / 'B' / 'A' / 'f5.LOG').write_text('e' * 7)
+    tree, index = scan_indexed(path)
+
+    assert _tree_shape(tree) == _tree_shape(FileSystemTree(path))
+    assert index.total.bytes == {'.txt': 40, '.log': 7}
+    assert index.total.files == {'.txt': 4, '.log': 1}
+    assert index.total.largest()[0] == ('.txt', 40)
+    _sort_subtrees(tree)
+    folder_a = tree._subtrees[0]
+    assert index.get_stats(folder_a).bytes == {'.txt': 30, '.log': 7}
+    assert index.get_stats(tree._subtrees[1]) is None
+    assert index_tree(tree).total.files == index.total.files
+
+
+def test_type_index_counts_empty_folders_as_files(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    (tmp_path / 'B' / 'E').mkdir()
+    tree, index = scan_indexed(path)
+    _sort_subtrees(tree)
+    empty = tree._subtrees[1]
+
+    assert empty._root == 'E' and empty._subtrees == []
+    assert index.total.files == {'.txt': 4, '': 1}
+    assert index.total.buckets[0] == 1
+    assert index_tree(tree).total.files == index.total.files
+    assert index.get_stats(empty) is None
+    index.remove(empty)
+    assert index.total.files == {'.txt': 4}
+
+
+def test_type_index_resize_and_remove(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    _sort_subtrees(tree)
+    index = index_tree(tree)
+    folder_a = tree._subtrees[0]
+    f1 = folder_a._subtrees[0]
+
+    f1.data_size = 20
+    index.resize(f1, 15, 20)
+    assert index.get_stats(folder_a).bytes['.txt'] == 35
+    # Sizes 20, 5, 10 and 10.
+    assert index.total.buckets == {3: 1, 4: 2, 5: 1}
+
+    index.remove(f1)
+    assert index.get_stats(folder_a).files == {'.txt': 2}
+    assert index.total.bytes == {'.txt': 25}
+
+
+def test_build_type_tree_groups_by_extension(tmp_path) -> None:
+    path = _make_example_dir(tmp_path)
+    (tmp_path / 'B' / 'A' / 'f5.log').write_text('e' * 7)
+    tree = FileSystemTree(path)
+    type_tree = build_type_tree(tree)
+
+    assert type_tree.data_size == 47
+    txt, log = type_tree._subtrees
+    assert (txt._root, txt.data_size, len(txt._subtrees)) == ('.txt', 40, 4)
+    assert (log._root, log.data_size) == ('.log', 7)
+    assert log._subtrees[0].source._root == 'f5.log'
+    assert len({leaf.colour for leaf in txt._subtrees}) == 1
+
+
+def test_shared_tree_matches_generate_treemap(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    _sort_subtrees(tree)
+    published = publish_tree(tree)
+    try:
+        shared = attach_tree(published.name)
+        try:
+            assert shared.size == 6
+            assert list(shared.parents) == [-1, 0, 1, 1, 1, 0]
+            assert shared.get_path(4) == 'B/A/f3.txt'
+            assert shared.get_subtrees(0) == [1, 5]
+            for rect in [(0, 0, 800, 1000), (10, 20, 1000, 300)]:
+                assert shared.generate_treemap(rect) == \
+                    tree.generate_treemap(rect)
+            assert shared.get_info((0, 0, 800, 1000), (10, 900)) == 5
+            # Clicks on the last layout do not compute it again.
+            layout = shared.layout((0, 0, 800, 1000))
+            assert shared.layout((0, 0, 800, 1000)) is layout
+            assert shared.get_info((0, 0, 800, 1000), (10, 10)) == 2
+            assert shared.layout((0, 0, 800, 1000)) is layout
+        finally:
+            shared.close()
+    finally:
+        published.close()
+        published.unlink()
+
+
+def test_shared_tree_attached_from_another_process(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    published = publish_tree(tree)
+    try:
+        script = ('import sys; sys.path.insert(0, sys.argv[1]); '
+                  'from shared_tree import attach_tree; '
+                  'tree = attach_tree(sys.argv[2]); print(tree.size); '
+                  'tree.close()')
+        child = subprocess.run(
+            [sys.executable, '-c', script,
+             os.path.dirname(os.path.abspath(__file__)), published.name],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, check=True)
+        assert child.stdout.strip() == '6'
+        assert 'leaked' not in child.stderr
+
+        # The segment outlives the process that attached it.
+        shared = attach_tree(published.name)
+        assert shared.size == 6
+        shared.close()
+    finally:
+        published.close()
+        published.unlink()
+
+
+_SPAWN_SCRIPT = """
+import multiprocessing
+import sys
+sys.path.insert(0, sys.argv[1])
+from scanner import make_node
+from shared_tree import attach_tree, publish_tree
+
+
+def view(name):
+    tree = attach_tree(name)
+    assert tree.size == 2
+    tree.close()
+
+
+if __name__ == '__main__':
+    multiprocessing.set_start_method('spawn')
+    published = publish_tree(make_node('B', [make_node('f', [], 3)]))
+    child = multiprocessing.Process(target=view, args=(published.name,))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    published.close()
+    published.unlink()
+"""
+
+
+def test_shared_tree_attached_from_multiprocessing_child(tmp_path) -> None:
+    # Run in a separate program, so that the output of the resource tracker
+    # it shares with its child can be checked.
+    script = tmp_path / 'handoff.py'
+    script.write_text(_SPAWN_SCRIPT)
+    result = subprocess.run(
+        [sys.executable, str(script),
+         os.path.dirname(os.path.abspath(__file__))],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    assert 'Error' not in result.stderr
+    assert 'leaked' not in result.stderr
+
+
+def test_instrumentation_counts_nodes_visited(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    original = AbstractTree.generate_treemap
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        rects = tree.generate_treemap((0, 0, 800, 1000))
+    finally:
+        instrumentation.disable()
+
+    assert len(rects) == 4
+    assert AbstractTree.generate_treemap is original
+    stats = instrumentation.summary()['generate_treemap']
+    assert stats['calls'] == 1
+    # B, A, f1.txt, f2.txt, f3.txt and f4.txt.
+    assert stats['nodes']['last'] == 6
+
+
+def test_instrumentation_disabled_records_nothing(tmp_path) -> None:
+    tree = FileSystemTree(_make_example_dir(tmp_path))
+    instrumentation.reset()
+    with instrumentation.timed('scan'):
+        tree.get_info((0, 0, 800, 1000), (10, 10))
+
+    assert instrumentation.summary() == {}
+
+
 ##############################################################################
 # Helper to sort subtrees alphabetically
 ##############################################################################
@@ -154,5 +759,29 @@ def _sort_subtrees(tree: AbstractTree) -> None:
         tree._subtrees.sort(key=lambda t: t._root)
 
 
+def _tree_shape(tree: AbstractTree) -> tuple:
+    """Return a nested tuple of the roots, sizes and subtrees of <tree>,
+    ignoring colours.
+    """
+    return (tree._root, tree.data_size,
+            [_tree_shape(subtree) for subtree in tree._subtrees])
+
+
+def _make_example_dir(tmp_path) -> str:
+    """Create a copy of the "B" folder of the sample data in <tmp_path> and
+    return its path.
+
+    B contains a folder A (with f1.txt, f2.txt and f3.txt, 30 bytes in total)
+    and a file f4.txt of 10 bytes.
+    """
+    root = tmp_path / 'B'
+    (root / 'A').mkdir(parents=True)
+    (root / 'A' / 'f1.txt').write_text('a' * 15)
+    (root / 'A' / 'f2.txt').write_text('b' * 5)
+    (root / 'A' / 'f3.txt').write_text('c' * 10)
+    (root / 'f4.txt').write_text('d' * 10)
+    return str(root)
+
+
 if __name__ == '__main__':
     pytest.main(['a2_test.py'])
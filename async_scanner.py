@@ -0,0 +1,322 @@
+"""Treemap: Scanning Network File Systems
+
+=== Module Description ===
+This module contains a scanner for file systems where every call has a high
+latency, like NFS or SMB mounts.
+
+FileSystemTree makes its os calls one at a time, so on such a file system it
+spends almost all its time waiting for the server. AsyncScanner instead runs
+the blocking calls in threads driven by asyncio, keeping up to
+max_concurrency of them in flight at once. The items still to be scanned wait
+in a queue, which max_concurrency worker tasks take them from, so the number
+of tasks does not grow with the size of the folders.
+
+Every call has a timeout, which also covers waiting for a place among the
+calls in flight; a folder that cannot be listed in time is recorded as empty,
+and a file that cannot be measured in time as having size 0, and their paths
+are kept in timed_out. A call that timed out is abandoned: it gives its place
+to another call and runs on in a daemon thread, so that calls that never
+return, as on a hard-mounted NFS share, hold up neither the scan nor the
+program's exit. Only max_abandoned calls are abandoned at once; past that, a
+call that timed out keeps its place until it returns.
+
+The calls go through a FileSystemLayer, so they can be replaced for testing:
+LatencyLayer adds a delay to every call to stand in for a slow server.
+"""
+
+from __future__ import annotations
+import asyncio
+import os
+import stat
+import threading
+import time
+from typing import Callable, List, Optional, Set
+
+from tree_data import FileSystemTree
+from scanner import Record, build_tree
+
+
+class FileSystemLayer:
+    """The blocking file system calls made by AsyncScanner."""
+
+    def listdir(self, path: str) -> List[str]:
+        """Return the names of the items in the folder at <path>."""
+        return os.listdir(path)
+
+    def stat(self, path: str) -> os.stat_result:
+        """Return the status of the file or folder at <path>, following
+        symbolic links.
+        """
+        return os.stat(path)
+
+
+class LatencyLayer(FileSystemLayer):
+    """A FileSystemLayer that waits before every call, like a file system on
+    a distant server.
+
+    === Public Attributes ===
+    delay: the number of seconds each call waits for.
+    max_in_flight: the largest number of calls that were running at once.
+
+    === Private Attributes ===
+    _in_flight: the number of calls running now.
+    _lock: protects _in_flight and max_in_flight.
+    """
+    delay: float
+    max_in_flight: int
+    _in_flight: int
+    _lock: threading.Lock
+
+    def __init__(self, delay: float) -> None:
+        """Initialize a layer whose calls each take <delay> more seconds."""
+        self.delay = delay
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def listdir(self, path: str) -> List[str]:
+        """Return the names of the items in the folder at <path>, after
+        waiting.
+        """
+        self._wait()
+        return FileSystemLayer.listdir(self, path)
+
+    def stat(self, path: str) -> os.stat_result:
+        """Return the status of the file or folder at <path>, after waiting.
+        """
+        self._wait()
+        return FileSystemLayer.stat(self, path)
+
+    def _wait(self) -> None:
+        """Wait for <delay> seconds, counting this call as in flight."""
+        with self._lock:
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self._in_flight -= 1
+
+
+class AsyncScanner:
+    """A scanner keeping many file system calls in flight at once.
+
+    === Public Attributes ===
+    max_concurrency: the largest number of calls in flight at once.
+    timeout: the number of seconds each call may take, including the time
+        it waits for a place among the calls in flight.
+    max_abandoned: the largest number of calls that timed out, but are still
+        running, whose places among the calls in flight are given to other
+        calls.
+    timed_out: the paths whose calls took too long in the last scan.
+
+    === Private Attributes ===
+    _layer: the file system calls used.
+    _semaphore: limits the calls in flight, during a scan.
+    _in_flight: the calls still running, during a scan.
+    _abandoned: the number of calls that timed out, are still running and
+        gave their places to other calls, during a scan.
+    """
+    max_concurrency: int
+    timeout: float
+    max_abandoned: int
+    timed_out: List[str]
+    _layer: FileSystemLayer
+    _semaphore: Optional[asyncio.Semaphore]
+    _in_flight: Set[asyncio.Future]
+    _abandoned: int
+
+    def __init__(self, max_concurrency: int = 64, timeout: float = 30,
+                 layer: Optional[FileSystemLayer] = None,
+                 max_abandoned: Optional[int] = None) -> None:
+        """Initialize a scanner using <layer> (by default, the os module).
+
+        <max_abandoned> is max_concurrency by default.
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        if max_abandoned is None:
+            max_abandoned = max_concurrency
+        self.max_abandoned = max_abandoned
+        self.timed_out = []
+        self._layer = FileSystemLayer() if layer is None else layer
+        self._semaphore = None
+        self._in_flight = set()
+        self._abandoned = 0
+
+    def scan(self, path: str) -> FileSystemTree:
+        """Return the FileSystemTree for <path>.
+
+        Apart from the items in timed_out, the result has the same shape and
+        sizes as FileSystemTree(path).
+
+        Precondition: <path> is a valid path for this computer.
+        """
+        return build_tree(asyncio.run(self.scan_record(path)))
+
+    async def scan_record(self, path: str) -> Record:
+        """Return the scanner record for <path>, for use in a running event
+        loop.
+
+        Precondition: <path> is a valid path for this computer.
+        """
+        self.timed_out = []
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._abandoned = 0
+        # The record for <path> is put in slots[0].
+        slots = [None]
+        queue = asyncio.LifoQueue()
+        queue.put_nowait((path, slots, 0))
+        workers = [asyncio.ensure_future(self._work(queue))
+                   for _ in range(self.max_concurrency)]
+        done = asyncio.ensure_future(queue.join())
+        try:
+            await asyncio.wait([done] + workers,
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in [done] + workers:
+                task.cancel()
+            results = await asyncio.gather(*workers, return_exceptions=True)
+            # Calls that timed out and are still running are abandoned.
+            for future in self._in_flight:
+                future.cancel()
+            self._semaphore = None
+            self._in_flight = set()
+        for result in results:
+            # A worker only stops by itself if it raised an error.
+            if isinstance(result, Exception):
+                raise result
+        return slots[0]
+
+    async def _call(self, func: Callable, path: str) -> object:
+        """Return func(path), run in a thread once fewer than max_concurrency
+        calls are in flight.
+
+        Raise asyncio.TimeoutError if getting a place among the calls in
+        flight and making the call take more than timeout seconds.
+
+        A call that timed out gives its place to another call, unless
+        max_abandoned such calls are still running; then it keeps its place
+        until it returns, so that the calls that never return cannot start
+        more and more threads.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        semaphore = self._semaphore
+        # Unlike asyncio.wait_for, asyncio.wait never hides a cancellation
+        # of the caller.
+        acquire = asyncio.ensure_future(semaphore.acquire())
+        try:
+            await asyncio.wait([acquire], timeout=self.timeout)
+        finally:
+            if not acquire.done():
+                acquire.cancel()
+        if not acquire.done():
+            raise asyncio.TimeoutError
+
+        future = _run_in_thread(func, path)
+        self._in_flight.add(future)
+        future.add_done_callback(self._in_flight.discard)
+        # Whether the call still has its place among the calls in flight.
+        has_place = [True]
+
+        def finish(_: asyncio.Future) -> None:
+            """Give back the place of the call, or stop counting it as
+            abandoned, once it returns.
+            """
+            if has_place[0]:
+                semaphore.release()
+            elif self._semaphore is semaphore:
+                self._abandoned -= 1
+        future.add_done_callback(finish)
+
+        done, _ = await asyncio.wait([future],
+                                     timeout=max(deadline - loop.time(), 0))
+        if not done:
+            # Its result, or error, is not wanted any more.
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            if self._abandoned < self.max_abandoned:
+                self._abandoned += 1
+                has_place[0] = False
+                semaphore.release()
+            raise asyncio.TimeoutError
+        return future.result()
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        """Scan the items in <queue> until cancelled.
+
+        Each item of <queue> is a path, with a list and an index in it where
+        to put the record for the path.
+        """
+        while True:
+            path, slots, i = await queue.get()
+            try:
+                slots[i] = await self._scan_path(path, queue)
+            finally:
+                queue.task_done()
+
+    async def _scan_path(self, path: str, queue: asyncio.Queue) -> Record:
+        """Return the record for the file or folder at <path>.
+
+        The record of a folder is returned with a slot for each of its items,
+        which are put in <queue> to be scanned.
+        """
+        name = os.path.basename(path)
+        try:
+            info = await self._call(self._layer.stat, path)
+        except asyncio.TimeoutError:
+            self.timed_out.append(path)
+            return name, 0, None
+        if not stat.S_ISDIR(info.st_mode):
+            return name, info.st_size, None
+
+        try:
+            names = await self._call(self._layer.listdir, path)
+        except asyncio.TimeoutError:
+            self.timed_out.append(path)
+            return name, 0, []
+        children = [None] * len(names)
+        for i, child in enumerate(names):
+            queue.put_nowait((os.path.join(path, child), children, i))
+        return name, 0, children
+
+
+def _run_in_thread(func: Callable, path: str) -> asyncio.Future:
+    """Return a future for func(path), run in a new daemon thread.
+
+    Daemon threads do not keep the program from exiting, so a call that never
+    returns cannot either.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def run() -> None:
+        """Make the call, and hand its result over to the event loop."""
+        try:
+            outcome = (future.set_result, func(path))
+        except Exception as error:
+            outcome = (future.set_exception, error)
+        try:
+            loop.call_soon_threadsafe(_settle, future, *outcome)
+        except RuntimeError:
+            # The event loop was closed, so nothing waits for the result.
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _settle(future: asyncio.Future, setter: Callable,
+            value: object) -> None:
+    """Give <future> its result or error <value> with <setter>, unless it
+    was cancelled.
+    """
+    if not future.cancelled():
+        setter(value)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['asyncio', 'os', 'stat', 'threading', 'time',
+                              'tree_data', 'scanner']})
@@ -0,0 +1,155 @@
+"""Treemap - Performance Benchmarks
+
+=== Module Description ===
+This module contains benchmarks for the treemap trees, using pytest-benchmark
+and the synthetic trees from tree_generators.
+
+The size of the generated trees is multiplied by the TREEMAP_BENCH_SCALE
+environment variable (1 by default, about two thousand leaves per tree);
+TREEMAP_BENCH_SCALE=1000 gives trees with millions of leaves.
+
+The benchmarks only run when pytest is given --run-benchmarks (see
+conftest.py). To catch a slowdown, record a baseline on the computer that
+will run the benchmarks, then compare later runs with it; the run fails if
+any benchmark got slower than the baseline by more than
+conftest.MAX_SLOWDOWN:
+    pytest benchmark_test.py --run-benchmarks --benchmark-save=baseline
+    pytest benchmark_test.py --run-benchmarks --benchmark-compare='*_baseline'
+
+Use --run-benchmarks --benchmark-disable to run each benchmark once, as a
+plain test.
+"""
+import os
+
+import pytest
+
+from population import PopulationTree
+from scanner import build_tree, scan_disk_usage, scan_parallel
+from tree_data import AbstractTree, FileSystemTree
+from tree_generators import (balanced_record, build_synthetic_tree,
+                             count_nodes, deep_record, tmpfs_dir, wide_record,
+                             write_record, zipf_record)
+
+pytest.importorskip('pytest_benchmark')
+
+SCALE = int(os.environ.get('TREEMAP_BENCH_SCALE', '1'))
+RECT = (0, 0, 1024, 738)
+
+SHAPES = {
+    'wide': lambda: wide_record(2000 * SCALE),
+    'deep': lambda: deep_record(min(200 * SCALE, 500)),
+    'balanced': lambda: balanced_record(12, 3 + (SCALE > 1) + (SCALE > 10)),
+    'zipf': lambda: zipf_record(2000 * SCALE),
+}
+
+
+@pytest.fixture(scope='module', params=sorted(SHAPES))
+def record(request):
+    return SHAPES[request.param]()
+
+
+@pytest.fixture(scope='module')
+def disk_tree(record, tmp_path_factory) -> str:
+    """Write <record> to a memory-backed folder if there is one, or to a
+    temporary folder otherwise, and return its path.
+    """
+    shm = tmpfs_dir()
+    if shm is None:
+        parent = str(tmp_path_factory.mktemp('bench'))
+    else:
+        parent = os.path.join(shm, 'treemap-bench-{}'.format(os.getpid()))
+        os.makedirs(parent, exist_ok=True)
+    path = write_record(record, parent)
+    yield path
+    _remove(parent)
+
+
+def test_filesystem_tree(benchmark, record, disk_tree) -> None:
+    tree = benchmark(FileSystemTree, disk_tree)
+    assert _count(tree) == count_nodes(record)
+
+
+def test_scan_parallel(benchmark, record, disk_tree) -> None:
+    tree = benchmark(scan_parallel, disk_tree)
+    assert _count(tree) == count_nodes(record)
+
+
+def test_scan_disk_usage(benchmark, record, disk_tree) -> None:
+    tree = benchmark(scan_disk_usage, disk_tree)
+    assert _count(tree) == count_nodes(record)
+
+
+def test_build_tree(benchmark, record) -> None:
+    benchmark(build_tree, record)
+
+
+def test_generate_treemap(benchmark, record) -> None:
+    tree = build_synthetic_tree(record)
+    rects = benchmark(tree.generate_treemap, RECT)
+    assert rects
+
+
+def test_get_info(benchmark, record) -> None:
+    tree = build_synthetic_tree(record)
+    leaf = benchmark(tree.get_info, RECT, (RECT[2] - 1, RECT[3] - 1))
+    assert leaf is not None
+
+
+def test_increase_size(benchmark, record) -> None:
+    tree = build_synthetic_tree(record)
+    leaf = _last_leaf(tree)
+    benchmark(tree.increase_size, leaf, 1)
+
+
+def test_decrease_size(benchmark, record) -> None:
+    tree = build_synthetic_tree(record)
+    leaf = _last_leaf(tree)
+    benchmark(tree.decrease_size, leaf, 0)
+
+
+def test_delete(benchmark, record) -> None:
+    def setup() -> tuple:
+        tree = build_synthetic_tree(record)
+        return (tree, _last_leaf(tree)), {}
+
+    def delete(tree: AbstractTree, leaf: AbstractTree) -> None:
+        tree.parent_remove(leaf)
+        tree.size_decrease(leaf)
+
+    # A single deletion is very short, so it is timed more often than the
+    # large trees would allow.
+    benchmark.pedantic(delete, setup=setup, rounds=50 if SCALE == 1 else 5)
+
+
+def test_population_tree(benchmark) -> None:
+    tree = benchmark(PopulationTree, True)
+    assert tree.data_size > 0
+
+
+##############################################################################
+# Helpers
+##############################################################################
+def _count(tree: AbstractTree) -> int:
+    """Return the number of nodes in <tree>."""
+    return 1 + sum(_count(subtree) for subtree in tree._subtrees)
+
+
+def _last_leaf(tree: AbstractTree) -> AbstractTree:
+    """Return the last leaf of <tree>, which is the slowest one to reach."""
+    while tree._subtrees:
+        tree = tree._subtrees[-1]
+    return tree
+
+
+def _remove(path: str) -> None:
+    """Remove the file or folder at <path>, and everything inside it."""
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            _remove(os.path.join(path, name))
+        os.rmdir(path)
+    else:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    pytest.main(['benchmark_test.py'])
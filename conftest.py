@@ -0,0 +1,50 @@
+"""Treemap - pytest Configuration
+
+=== Module Description ===
+This module configures how pytest runs the benchmarks in benchmark_test.py.
+
+The benchmarks are skipped unless pytest is given --run-benchmarks. Runs are
+saved in, and compared with, the .benchmarks folder next to this file. Timings
+only mean something on the computer that recorded them, so no baseline is
+kept with the code and nothing is compared unless pytest is also given
+--benchmark-compare; the run then fails if any benchmark got more than
+MAX_SLOWDOWN slower than the saved run, unless --benchmark-compare-fail says
+otherwise.
+"""
+import os
+
+# How much slower than the saved run a benchmark may get, as a
+# --benchmark-compare-fail expression. The shortest benchmarks can vary by
+# more than half from one run to the next on a busy computer, so only a
+# benchmark that got twice as slow fails the run.
+MAX_SLOWDOWN = 'median:100%'
+
+# The folder where pytest-benchmark saves runs, by default.
+DEFAULT_STORAGE = 'file://./.benchmarks'
+STORAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '.benchmarks')
+
+
+def pytest_addoption(parser) -> None:
+    """Add the --run-benchmarks option."""
+    parser.addoption('--run-benchmarks', action='store_true', default=False,
+                     help='run the benchmarks in benchmark_test.py')
+
+
+def pytest_configure(config) -> None:
+    """Skip the benchmarks, or set up where they are saved and how they are
+    compared.
+    """
+    if not config.pluginmanager.hasplugin('benchmark'):
+        return
+    from pytest_benchmark.utils import parse_compare_fail
+
+    if not config.getoption('run_benchmarks'):
+        config.option.benchmark_skip = True
+        return
+    if config.getoption('benchmark_storage') == DEFAULT_STORAGE:
+        config.option.benchmark_storage = 'file://' + STORAGE_PATH
+    if config.getoption('benchmark_compare') \
+            and not config.getoption('benchmark_compare_fail'):
+        config.option.benchmark_compare_fail = \
+            [parse_compare_fail(MAX_SLOWDOWN)]
@@ -0,0 +1,231 @@
+"""Treemap: Instrumentation
+
+=== Module Description ===
+This module contains an opt-in profiling layer for the treemap visualiser.
+
+While instrumentation is disabled (the default), nothing in this module runs:
+the AbstractTree methods are the original ones, and timed() only checks a
+flag. Calling enable() replaces the hot-path methods of AbstractTree with
+wrappers that record, for every outermost call:
+  - the number of calls,
+  - a histogram of the time taken, and
+  - a histogram of the number of nodes visited (i.e., the number of recursive
+    calls made to the same method).
+Calling disable() puts the original methods back.
+
+The visualiser also records the time spent scanning and drawing with
+timed(), and shows overlay_text() in its status bar while enabled.
+
+Example:
+    import instrumentation
+    from treemap_visualiser import run_treemap_file_system
+
+    instrumentation.enable()
+    run_treemap_file_system('/some/path')
+    instrumentation.dump('profile.json')
+"""
+
+from __future__ import annotations
+import functools
+import json
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+from tree_data import AbstractTree
+
+# The AbstractTree methods that are wrapped by enable().
+INSTRUMENTED_METHODS = ['generate_treemap', 'get_info', 'get_text',
+                        'parent_remove', 'size_decrease', 'increase_size',
+                        'decrease_size']
+
+# The entry points shown by overlay_text(), in order.
+OVERLAY_NAMES = ['scan', 'render', 'generate_treemap', 'get_info']
+
+
+class Histogram:
+    """A histogram of non-negative values, with power-of-two buckets.
+
+    === Public Attributes ===
+    count: the number of values recorded.
+    total: the sum of the values recorded.
+    last: the most recently recorded value.
+    buckets: maps i to the number of values v recorded with
+        2 ** (i - 1) <= v < 2 ** i (bucket 0 holds values less than 1).
+    """
+    count: int
+    total: float
+    last: float
+    buckets: Dict[int, int]
+
+    def __init__(self: Histogram) -> None:
+        """Initialize an empty Histogram."""
+        self.count = 0
+        self.total = 0
+        self.last = 0
+        self.buckets = {}
+
+    def record(self: Histogram, value: float) -> None:
+        """Add <value> to this histogram."""
+        self.count += 1
+        self.total += value
+        self.last = value
+        bucket = int(value).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def to_dict(self: Histogram) -> dict:
+        """Return a JSON-compatible representation of this histogram.
+
+        Buckets are keyed by the (exclusive) upper bound of their values.
+        """
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0,
+                'last': self.last,
+                'buckets': {str(2 ** i): n
+                            for i, n in sorted(self.buckets.items())}}
+
+
+class _Stats:
+    """The measurements recorded for one entry point.
+
+    === Public Attributes ===
+    calls: the number of outermost calls.
+    micros: the time taken by each call, in microseconds.
+    nodes: the number of nodes visited by each call.
+    """
+    calls: int
+    micros: Histogram
+    nodes: Histogram
+
+    def __init__(self: _Stats) -> None:
+        """Initialize stats with no calls recorded."""
+        self.calls = 0
+        self.micros = Histogram()
+        self.nodes = Histogram()
+
+
+_enabled = False
+_stats: Dict[str, _Stats] = {}
+_originals: Dict[str, Callable] = {}
+# Maps the name of each method currently running to a one-element list
+# counting the nodes visited so far by its outermost call.
+_active: Dict[str, List[int]] = {}
+
+
+def is_enabled() -> bool:
+    """Return True if instrumentation is enabled."""
+    return _enabled
+
+
+def enable() -> None:
+    """Start recording measurements.
+
+    Recorded measurements are kept until reset() is called.
+    """
+    global _enabled
+    if _enabled:
+        return
+    for name in INSTRUMENTED_METHODS:
+        method = getattr(AbstractTree, name)
+        _originals[name] = method
+        setattr(AbstractTree, name, _wrap(name, method))
+    _enabled = True
+
+
+def disable() -> None:
+    """Stop recording measurements, restoring the original methods."""
+    global _enabled
+    for name, method in _originals.items():
+        setattr(AbstractTree, name, method)
+    _originals.clear()
+    _enabled = False
+
+
+def reset() -> None:
+    """Forget all recorded measurements."""
+    _stats.clear()
+
+
+def record(name: str, seconds: float, nodes: int = 1) -> None:
+    """Record one call to the entry point <name>, which took <seconds> and
+    visited <nodes> nodes.
+    """
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = _Stats()
+    stats.calls += 1
+    stats.micros.record(seconds * 1e6)
+    stats.nodes.record(nodes)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Record the time spent in the body of the with statement as one call
+    to <name>, if instrumentation is enabled.
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def _wrap(name: str, method: Callable) -> Callable:
+    """Return a version of <method> that records its outermost calls under
+    <name>, counting the recursive calls made in between as nodes visited.
+    """
+    @functools.wraps(method)
+    def wrapper(*args: object, **kwargs: object) -> object:
+        visited = _active.get(name)
+        if visited is not None:
+            visited[0] += 1
+            return method(*args, **kwargs)
+
+        visited = _active[name] = [1]
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            del _active[name]
+            record(name, time.perf_counter() - start, visited[0])
+    return wrapper
+
+
+def summary() -> Dict[str, dict]:
+    """Return a JSON-compatible summary of all recorded measurements."""
+    return {name: {'calls': stats.calls,
+                   'microseconds': stats.micros.to_dict(),
+                   'nodes': stats.nodes.to_dict()}
+            for name, stats in sorted(_stats.items())}
+
+
+def dump(path: str) -> None:
+    """Write summary() to the file at <path> as JSON."""
+    with open(path, 'w') as f:
+        json.dump(summary(), f, indent=2)
+
+
+def overlay_text() -> str:
+    """Return a one-line description of the last call to each of the main
+    entry points, for display in the visualiser's status bar.
+    """
+    parts = []
+    for name in OVERLAY_NAMES:
+        stats = _stats.get(name)
+        if stats is not None:
+            parts.append('{} {:.1f}ms/{}n'.format(
+                name, stats.micros.last / 1000, int(stats.nodes.last)))
+    return '  '.join(parts)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['dump'],
+            'extra-imports': ['functools', 'json', 'time', 'contextlib',
+                              'tree_data']})
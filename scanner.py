@@ -0,0 +1,251 @@
+"""Treemap: File System Scanning
+
+=== Module Description ===
+This module contains alternative ways of building a FileSystemTree.
+
+Rather than creating FileSystemTree objects while walking the disk, a scan
+first produces a *record* for every file and folder: a plain tuple
+(name, data_size, children), where children is None for a regular file and
+a list of records for a folder. build_tree then turns a record into a
+FileSystemTree.
+
+scan_parallel scans in worker processes, which send their records back
+flattened: as plain lists of names, sizes and child counts, which are small
+to pickle and need no recursion to do so. The parent process then builds the
+nodes from them, setting the _parent_tree and data_size of each.
+"""
+
+from __future__ import annotations
+import os
+import stat
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+from tree_data import AbstractTree, FileSystemTree
+
+# A scanned file or folder: (name, data_size, children or None for a file).
+Record = Tuple[str, int, Optional[list]]
+
+# A record flattened in post-order: the names, the data sizes and the number
+# of children of its files and folders, with FILE_COUNT for a file.
+FlatRecord = Tuple[List[str], List[int], List[int]]
+FILE_COUNT = -1
+
+# The unit of st_blocks, as defined by POSIX.
+BLOCK_SIZE = 512
+
+
+def scan_record(path: str) -> Record:
+    """Return the record for the file or folder at <path>.
+
+    The sizes and the order of the children are the same as the ones
+    FileSystemTree(path) would produce.
+
+    Precondition: <path> is a valid path for this computer.
+    """
+    name = os.path.basename(path)
+    if not os.path.isdir(path):
+        return name, os.path.getsize(path), None
+    return name, 0, _scan_children(path)
+
+
+def _scan_children(path: str) -> List[Record]:
+    """Return the records of the items in the folder at <path>."""
+    children = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                children.append((entry.name, 0, _scan_children(entry.path)))
+            else:
+                children.append((entry.name, entry.stat().st_size, None))
+    return children
+
+
+def scan_disk_usage_record(path: str,
+                           one_filesystem: bool = False) -> Record:
+    """Return the record for the file or folder at <path>, using the disk
+    space actually allocated to each file rather than its apparent size.
+
+    - The size of a file is computed from st_blocks, so sparse files only
+      count the blocks they use. On systems without st_blocks, st_size is
+      used instead.
+    - A file with several hard links is only counted the first time it is
+      seen; the other links are recorded with a size of 0.
+    - Symbolic links are never followed: a link is recorded as a file with
+      the size of the link itself, so cycles cannot occur.
+    - If <one_filesystem> is True, folders on a different device than <path>
+      (i.e., mount points) are recorded as empty folders.
+
+    As with FileSystemTree, the space used by the folders themselves is not
+    counted.
+
+    Precondition: <path> is a valid path for this computer.
+    """
+    info = os.lstat(path)
+    name = os.path.basename(path)
+    seen = set()
+    if not stat.S_ISDIR(info.st_mode):
+        return name, _allocated_size(info, seen), None
+    device = info.st_dev if one_filesystem else None
+    return name, 0, _scan_disk_usage_children(path, device, seen)
+
+
+def _scan_disk_usage_children(path: str, device: Optional[int],
+                              seen: Set[Tuple[int, int]]) -> List[Record]:
+    """Return the disk usage records of the items in the folder at <path>.
+
+    If <device> is not None, folders on another device are not entered.
+    <seen> holds the (st_dev, st_ino) of the hard-linked files counted so far.
+    """
+    children = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            info = entry.stat(follow_symlinks=False)
+            if not stat.S_ISDIR(info.st_mode):
+                children.append(
+                    (entry.name, _allocated_size(info, seen), None))
+            elif device is not None and info.st_dev != device:
+                children.append((entry.name, 0, []))
+            else:
+                children.append((entry.name, 0, _scan_disk_usage_children(
+                    entry.path, device, seen)))
+    return children
+
+
+def _allocated_size(info: os.stat_result,
+                    seen: Set[Tuple[int, int]]) -> int:
+    """Return the number of bytes allocated to the file described by <info>,
+    or 0 if it is a hard link to a file that is already in <seen>.
+
+    Only files with more than one link are added to <seen>, which keeps it
+    small on trees without hard links.
+    """
+    if info.st_nlink > 1:
+        key = (info.st_dev, info.st_ino)
+        if key in seen:
+            return 0
+        seen.add(key)
+    blocks = getattr(info, 'st_blocks', None)
+    if blocks is None:
+        return info.st_size
+    return blocks * BLOCK_SIZE
+
+
+def make_node(name: str, subtrees: List[FileSystemTree],
+              data_size: int = 0) -> FileSystemTree:
+    """Return a FileSystemTree with the given root <name>, <subtrees> and
+    <data_size>, without looking at the disk.
+
+    As with the AbstractTree constructor, <data_size> is ignored if
+    <subtrees> is not empty.
+    """
+    tree = FileSystemTree.__new__(FileSystemTree)
+    AbstractTree.__init__(tree, name, subtrees, data_size)
+    return tree
+
+
+def build_tree(record: Record) -> FileSystemTree:
+    """Return the FileSystemTree described by <record>.
+
+    The AbstractTree constructor sets the _parent_tree of every subtree and
+    computes the data_size of every folder from its children.
+    """
+    name, data_size, children = record
+    if children is None:
+        return make_node(name, [], data_size)
+    return make_node(name, [build_tree(child) for child in children])
+
+
+def scan_disk_usage(path: str,
+                    one_filesystem: bool = False) -> FileSystemTree:
+    """Return the FileSystemTree for <path>, with the data_size of each file
+    being the disk space allocated to it.
+
+    See scan_disk_usage_record for how sizes are computed.
+
+    Precondition: <path> is a valid path for this computer.
+    """
+    return build_tree(scan_disk_usage_record(path, one_filesystem))
+
+
+def scan_parallel(path: str,
+                  max_workers: Optional[int] = None) -> FileSystemTree:
+    """Return the FileSystemTree for <path>, scanning its top-level items in
+    separate processes.
+
+    Each item directly inside <path> is scanned by a worker of a
+    ProcessPoolExecutor with at most <max_workers> processes (by default,
+    one per CPU), which sends back its flattened record. The parent builds
+    the subtrees from them and joins them under the root, in the same order
+    as os.listdir reports them, so the result has the same shape and sizes
+    as FileSystemTree(path).
+
+    Precondition: <path> is a valid path for this computer.
+    """
+    if not os.path.isdir(path):
+        return scan_tree(path)
+
+    child_paths = [os.path.join(path, name) for name in os.listdir(path)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        children = [build_flat_tree(flat)
+                    for flat in executor.map(_scan_flat, child_paths)]
+    return make_node(os.path.basename(path), children)
+
+
+def scan_tree(path: str) -> FileSystemTree:
+    """Return the FileSystemTree for <path>, scanning it with scan_record.
+
+    Precondition: <path> is a valid path for this computer.
+    """
+    return build_tree(scan_record(path))
+
+
+def flatten_record(record: Record) -> FlatRecord:
+    """Return <record> flattened in post-order."""
+    names, sizes, counts = [], [], []
+    # The records still to visit, with whether their children were pushed.
+    stack = [(record, False)]
+    while stack:
+        (name, data_size, children), expanded = stack.pop()
+        if children and not expanded:
+            stack.append(((name, data_size, children), True))
+            stack.extend((child, False) for child in reversed(children))
+            continue
+        names.append(name)
+        sizes.append(data_size)
+        counts.append(FILE_COUNT if children is None else len(children))
+    return names, sizes, counts
+
+
+def build_flat_tree(flat: FlatRecord) -> FileSystemTree:
+    """Return the FileSystemTree described by the flattened record <flat>.
+
+    As with build_tree, the AbstractTree constructor sets the _parent_tree
+    of every subtree and computes the data_size of every folder.
+    """
+    # The trees built so far whose parent is not built yet.
+    pending = []
+    for name, data_size, count in zip(*flat):
+        if count == FILE_COUNT:
+            pending.append(make_node(name, [], data_size))
+        else:
+            subtrees = pending[len(pending) - count:]
+            del pending[len(pending) - count:]
+            pending.append(make_node(name, subtrees))
+    return pending[0]
+
+
+def _scan_flat(path: str) -> FlatRecord:
+    """Return the flattened record for <path>, for a worker of
+    scan_parallel.
+    """
+    return flatten_record(scan_record(path))
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['os', 'stat', 'concurrent.futures',
+                              'tree_data'],
+            'generated-members': 'pygame.*'})
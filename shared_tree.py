@@ -0,0 +1,285 @@
+"""Treemap: Sharing Trees Between Processes
+
+=== Module Description ===
+This module contains a way to hand a tree from one process (e.g. a scanner)
+to another (e.g. the visualiser) without pickling every node.
+
+publish_tree writes the tree into a multiprocessing.shared_memory segment as
+flat arrays, with the nodes in depth-first order (every node comes before
+its subtrees):
+  - parents[i]: the index of the parent of node i, or -1 for the root.
+  - ends[i]: the index just after the last node below node i, so that the
+    subtrees of i start at i + 1, and each one ends where the next starts.
+  - sizes[i]: the data_size of node i.
+  - name_offsets[i]: where the name of node i starts in the string blob; it
+    ends at name_offsets[i + 1].
+  - colours[3 * i:3 * i + 3]: the colour of node i.
+followed by the UTF-8 names of all the nodes, one after the other.
+
+attach_tree maps the same segment in another process; its arrays are views
+of the shared memory, not copies, and SharedTree.generate_treemap lays the
+tree out straight from them.
+"""
+
+from __future__ import annotations
+import math
+import struct
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional, Tuple
+
+from tree_data import AbstractTree
+
+# The header of a segment: magic bytes, format version, number of nodes and
+# length of the string blob.
+HEADER = struct.Struct('<4sIqq')
+MAGIC = b'TMAP'
+VERSION = 1
+
+# The type code of the integers in the arrays (signed 64 bits, in the byte
+# order of this computer), and their size in bytes.
+INT_TYPE = 'q'
+INT_SIZE = 8
+
+
+class SharedTree:
+    """A tree stored as flat arrays in a shared memory segment.
+
+    === Public Attributes ===
+    name: the name of the shared memory segment.
+    size: the number of nodes in the tree.
+    parents, ends, sizes, name_offsets: the integer arrays described in the
+        module docstring, as views of the segment.
+    colours: the colours of the nodes, as a view of the segment.
+
+    === Private Attributes ===
+    _shm: the shared memory segment.
+    _blob: the names of the nodes, as a view of the segment.
+    _layout_rect: the rectangle of the last layout computed, if any.
+    _layout: the last layout computed. The tree cannot change, so it stays
+        valid for _layout_rect.
+    """
+    name: str
+    size: int
+    parents: memoryview
+    ends: memoryview
+    sizes: memoryview
+    name_offsets: memoryview
+    colours: memoryview
+    _shm: shared_memory.SharedMemory
+    _blob: memoryview
+    _layout_rect: Optional[Tuple[int, int, int, int]]
+    _layout: List[Tuple[Tuple[int, int, int, int], int]]
+
+    def __init__(self, shm: shared_memory.SharedMemory) -> None:
+        """Initialize the views of the tree stored in <shm>.
+
+        Precondition: <shm> was filled in by publish_tree.
+        """
+        magic, version, size, blob_length = HEADER.unpack_from(shm.buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a shared tree: ' + shm.name)
+        self.name = shm.name
+        self.size = size
+        self._shm = shm
+
+        start = HEADER.size
+        arrays = []
+        for length in [size, size, size, size + 1]:
+            end = start + length * INT_SIZE
+            arrays.append(shm.buf[start:end].cast(INT_TYPE))
+            start = end
+        self.parents, self.ends, self.sizes, self.name_offsets = arrays
+        self.colours = shm.buf[start:start + 3 * size]
+        start += 3 * size
+        self._blob = shm.buf[start:start + blob_length]
+        self._layout_rect = None
+        self._layout = []
+
+    def get_name(self, i: int) -> str:
+        """Return the name of node <i>."""
+        return str(self._blob[self.name_offsets[i]:self.name_offsets[i + 1]],
+                   'utf-8')
+
+    def get_colour(self, i: int) -> Tuple[int, int, int]:
+        """Return the colour of node <i>."""
+        return (self.colours[3 * i], self.colours[3 * i + 1],
+                self.colours[3 * i + 2])
+
+    def get_subtrees(self, i: int) -> List[int]:
+        """Return the indexes of the subtrees of node <i>, in order."""
+        subtrees = []
+        child = i + 1
+        while child < self.ends[i]:
+            subtrees.append(child)
+            child = self.ends[child]
+        return subtrees
+
+    def get_path(self, i: int, separator: str = '/') -> str:
+        """Return the names of the nodes from the root down to node <i>,
+        joined by <separator>.
+        """
+        names = []
+        while i != -1:
+            names.append(self.get_name(i))
+            i = self.parents[i]
+        names.reverse()
+        return separator.join(names)
+
+    def layout(self, rect: Tuple[int, int, int, int]) \
+            -> List[Tuple[Tuple[int, int, int, int], int]]:
+        """Return the rectangle of each non-empty leaf when the tree is laid
+        out in <rect>, with the index of the leaf.
+
+        The rectangles are the same, and in the same order, as the ones
+        AbstractTree.generate_treemap returns for the original tree. The
+        layout is only computed again if <rect> is not the one of the last
+        call; the result must not be changed.
+        """
+        if rect == self._layout_rect:
+            return self._layout
+        ans = []
+        stack = [(0, rect)] if self.size else []
+        while stack:
+            i, (x, y, width, height) = stack.pop()
+            data_size = self.sizes[i]
+            if data_size == 0:
+                continue
+            subtrees = self.get_subtrees(i)
+            if not subtrees:
+                ans.append(((x, y, width, height), i))
+                continue
+
+            rects = []
+            used = 0
+            for child in subtrees[:-1]:
+                percentage = self.sizes[child] / data_size
+                if width > height:
+                    new_width = math.floor(percentage * width)
+                    rects.append((child, (x + used, y, new_width, height)))
+                    used += new_width
+                else:
+                    new_height = math.floor(percentage * height)
+                    rects.append((child, (x, y + used, width, new_height)))
+                    used += new_height
+            if width > height:
+                rects.append((subtrees[-1],
+                              (x + used, y, width - used, height)))
+            else:
+                rects.append((subtrees[-1],
+                              (x, y + used, width, height - used)))
+            stack.extend(reversed(rects))
+        self._layout_rect, self._layout = rect, ans
+        return ans
+
+    def generate_treemap(self, rect: Tuple[int, int, int, int]) \
+            -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int]]]:
+        """Run the treemap algorithm on this tree and return the rectangles,
+        in the same format as AbstractTree.generate_treemap.
+        """
+        return [(leaf_rect, self.get_colour(i))
+                for leaf_rect, i in self.layout(rect)]
+
+    def get_info(self, rect: Tuple[int, int, int, int],
+                 point: Tuple[int, int]) -> Optional[int]:
+        """Return the index of the leaf under <point> when the tree is laid
+        out in <rect>, or None if there is none.
+
+        The layout is the one already computed for <rect> by generate_treemap,
+        if it was the last rectangle the tree was laid out in.
+        """
+        for (x, y, width, height), i in self.layout(rect):
+            if x <= point[0] <= x + width and y <= point[1] <= y + height:
+                return i
+        return None
+
+    def close(self) -> None:
+        """Stop using the segment in this process."""
+        for view in [self.parents, self.ends, self.sizes, self.name_offsets,
+                     self.colours, self._blob]:
+            view.release()
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """Free the segment. This should be called once, by the process that
+        published the tree, after every process has closed it.
+        """
+        self._shm.unlink()
+
+
+def publish_tree(tree: AbstractTree, name: Optional[str] = None) \
+        -> SharedTree:
+    """Write <tree> into a new shared memory segment called <name> (by
+    default, a unique name), and return it.
+
+    The caller must close and unlink the result once it is not needed.
+    """
+    parents, ends, sizes, colours, names = [], [], [], bytearray(), []
+    # The nodes to visit, with their parent's index, and markers (None) to
+    # record where the nodes below a node end.
+    stack = [(tree, -1)]
+    while stack:
+        node, parent = stack.pop()
+        if node is None:
+            ends[parent] = len(parents)
+            continue
+        index = len(parents)
+        parents.append(parent)
+        ends.append(index + 1)
+        sizes.append(node.data_size)
+        colours.extend(node.colour)
+        names.append(b'' if node.is_empty() else str(node._root).encode())
+        stack.append((None, index))
+        stack.extend((child, index) for child in reversed(node._subtrees))
+
+    name_offsets = [0]
+    for node_name in names:
+        name_offsets.append(name_offsets[-1] + len(node_name))
+    blob = b''.join(names)
+    size = len(parents)
+
+    total = HEADER.size + (4 * size + 1) * INT_SIZE + 3 * size + len(blob)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+    HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, size, len(blob))
+    start = HEADER.size
+    for values in [parents, ends, sizes, name_offsets]:
+        data = array(INT_TYPE, values).tobytes()
+        shm.buf[start:start + len(data)] = data
+        start += len(data)
+    shm.buf[start:start + 3 * size] = colours
+    start += 3 * size
+    shm.buf[start:start + len(blob)] = blob
+    return SharedTree(shm)
+
+
+def attach_tree(name: str) -> SharedTree:
+    """Return the tree published in the shared memory segment called <name>,
+    without copying it.
+
+    The caller must close the result once it is not needed.
+    """
+    # The publishing process owns the segment, so this one should not
+    # unlink it when it exits.
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13, attaching registers the segment with the
+        # resource tracker, which would unlink it when this process exits.
+        # The tracker may be the publisher's (e.g. in a process started by
+        # multiprocessing), so the registration is skipped rather than
+        # undone afterwards.
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+    return SharedTree(shm)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['math', 'struct', 'array', 'multiprocessing',
+                              'tree_data']})
@@ -168,6 +168,17 @@ class AbstractTree:
         for child_tree in self._subtrees:
             child_tree.parent_remove(item)
 
+    def get_child_containing(self, item: AbstractTree) \
+            -> Optional[AbstractTree]:
+        """
+        Function used in event_loop to zoom into a subtree. Return the
+        subtree of self that contains item (possibly item itself), or None
+        if item is not inside self.
+        """
+        while item is not None and item._parent_tree is not self:
+            item = item._parent_tree
+        return item
+
     def change_size(self, size: int) -> int:
         """
         This function will be used in treemap_visualiser.
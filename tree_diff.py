@@ -0,0 +1,255 @@
+"""Treemap: Comparing Snapshots
+
+=== Module Description ===
+This module contains a diff engine for comparing two scans of a file system,
+e.g. yesterday's and today's.
+
+Both sides are read as *entry streams*: depth-first sequences of
+(path, data_size, is_folder), where path is the tuple of names from the root
+(the root itself has path ()) and the children of every folder come in
+sorted order. With that order, the paths of a stream are sorted, so the two
+streams can be merged in a single pass, like the merge step of merge sort.
+Only leaf sizes are read from the streams; folder sizes are added up during
+the merge, which holds one open folder per level. Both the merge and the
+streams themselves therefore use memory proportional to the depth of the
+trees, not their size.
+
+The result is itself a stream, in post-order, of
+(path, old_size, new_size, is_folder), which build_diff_tree turns into a
+DiffTree for the treemap visualiser. When the DiffTree is sized by growth,
+only the items that changed get a node, so it is as small as the change.
+"""
+
+from __future__ import annotations
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from tree_data import AbstractTree
+
+# (path from the root, data_size, is_folder)
+Entry = Tuple[Tuple[str, ...], int, bool]
+
+# (path from the root, old data_size, new data_size, is_folder)
+Change = Tuple[Tuple[str, ...], int, int, bool]
+
+# The colour of the leaves whose size did not change.
+UNCHANGED_COLOUR = (128, 128, 128)
+
+# The name of the leaf holding the file side of an item that is a file in one
+# snapshot and a folder in the other.
+FILE_SIDE_NAME = '(file)'
+
+
+class DiffTree(AbstractTree):
+    """A tree showing the changes between two snapshots of a tree.
+
+    Leaves that grew are red, leaves that shrank are blue, and the more their
+    size changed relative to their larger size, the stronger the colour.
+
+    === Public Attributes ===
+    old_size: the size of this tree in the old snapshot (0 if it was added).
+    new_size: the size of this tree in the new snapshot (0 if it was
+        removed).
+
+    The data_size of a leaf is abs(new_size - old_size) if the tree is sized
+    by growth, or new_size otherwise.
+    """
+    old_size: int
+    new_size: int
+
+    def __init__(self: DiffTree, root: object, old_size: int, new_size: int,
+                 subtrees: List[DiffTree], by_growth: bool = True) -> None:
+        """Initialize a new DiffTree.
+
+        The data_size of a DiffTree with subtrees is computed from them, as
+        for any AbstractTree.
+        """
+        if by_growth:
+            data_size = abs(new_size - old_size)
+        else:
+            data_size = new_size
+        AbstractTree.__init__(self, root, subtrees, data_size)
+        self.old_size = old_size
+        self.new_size = new_size
+        self.colour = _growth_colour(old_size, new_size)
+
+    def get_separator(self: AbstractTree) -> str:
+        """Return the string used to separate nodes in the string
+        representation of a path from the tree root to a leaf."""
+        return os.sep
+
+
+def _growth_colour(old_size: int, new_size: int) -> Tuple[int, int, int]:
+    """Return the colour of a leaf whose size went from <old_size> to
+    <new_size>.
+    """
+    if old_size == new_size:
+        return UNCHANGED_COLOUR
+    ratio = abs(new_size - old_size) / max(old_size, new_size)
+    fade = int(200 * (1 - ratio))
+    if new_size > old_size:
+        return 255, fade, fade
+    return fade, fade, 255
+
+
+def iter_tree_entries(tree: AbstractTree) -> Iterator[Entry]:
+    """Yield the entries of <tree>, with the children of every node sorted
+    by name.
+
+    Nodes with subtrees are folders; every other node is a leaf.
+    """
+    stack = [((), tree)]
+    while stack:
+        path, node = stack.pop()
+        if not node._subtrees:
+            yield path, node.data_size, False
+            continue
+        yield path, 0, True
+        children = sorted(node._subtrees, key=lambda t: str(t._root),
+                          reverse=True)
+        stack.extend((path + (str(child._root),), child)
+                     for child in children if not child.is_empty())
+
+
+def iter_disk_entries(path: str) -> Iterator[Entry]:
+    """Yield the entries of the file or folder at <path>, with the items of
+    every folder sorted by name, without building a tree.
+
+    Sizes are the ones FileSystemTree(path) would use.
+
+    Precondition: <path> is a valid path for this computer.
+    """
+    if not os.path.isdir(path):
+        yield (), os.path.getsize(path), False
+        return
+    yield (), 0, True
+    stack = [((), iter(_sorted_entries(path)))]
+    while stack:
+        prefix, entries = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+        elif entry.is_dir():
+            yield prefix + (entry.name,), 0, True
+            stack.append((prefix + (entry.name,),
+                          iter(_sorted_entries(entry.path))))
+        else:
+            yield prefix + (entry.name,), entry.stat().st_size, False
+
+
+def _sorted_entries(path: str) -> List[os.DirEntry]:
+    """Return the items of the folder at <path>, sorted by name."""
+    with os.scandir(path) as entries:
+        return sorted(entries, key=lambda entry: entry.name)
+
+
+def diff_entries(old: Iterable[Entry],
+                 new: Iterable[Entry]) -> Iterator[Change]:
+    """Yield the changes between the entry streams <old> and <new>, in
+    post-order (every folder comes after everything inside it).
+
+    An item missing from one side has a size of 0 on that side. An item that
+    is a file on one side and a folder on the other is treated as a folder,
+    with the file side given as a leaf called FILE_SIDE_NAME inside it,
+    unless that leaf has size 0 on both sides: iter_tree_entries cannot tell
+    an empty folder from an empty file, so it reports empty folders as
+    files, and they should diff the same way as with iter_disk_entries.
+    """
+    old_iter, new_iter = iter(old), iter(new)
+    a, b = next(old_iter, None), next(new_iter, None)
+    # The folders containing the current item: [path, old_size, new_size].
+    open_folders = []
+    while a is not None or b is not None:
+        type_changed = False
+        if b is None or (a is not None and a[0] < b[0]):
+            path, old_size, new_size, is_folder = a[0], a[1], 0, a[2]
+            a = next(old_iter, None)
+        elif a is None or b[0] < a[0]:
+            path, old_size, new_size, is_folder = b[0], 0, b[1], b[2]
+            b = next(new_iter, None)
+        else:
+            path, old_size, new_size, is_folder = a[0], a[1], b[1], a[2] or b[2]
+            type_changed = a[2] != b[2]
+            a, b = next(old_iter, None), next(new_iter, None)
+
+        while open_folders and \
+                path[:len(open_folders[-1][0])] != open_folders[-1][0]:
+            yield _close_folder(open_folders)
+        if is_folder:
+            open_folders.append([path, 0, 0])
+            if not type_changed or old_size == new_size == 0:
+                continue
+            # The folder side has size 0, so the sizes are the file side's.
+            path += (FILE_SIDE_NAME,)
+        if open_folders:
+            open_folders[-1][1] += old_size
+            open_folders[-1][2] += new_size
+        yield path, old_size, new_size, False
+
+    while open_folders:
+        yield _close_folder(open_folders)
+
+
+def _close_folder(open_folders: List[list]) -> Change:
+    """Remove the innermost folder from <open_folders>, add its sizes to its
+    parent's, and return its change.
+    """
+    path, old_size, new_size = open_folders.pop()
+    if open_folders:
+        open_folders[-1][1] += old_size
+        open_folders[-1][2] += new_size
+    return path, old_size, new_size, True
+
+
+def build_diff_tree(changes: Iterable[Change], root: object,
+                    by_growth: bool = True) -> Optional[DiffTree]:
+    """Return the DiffTree for the post-order stream <changes>, with <root>
+    as the name of its root, or None if <changes> is empty.
+
+    If <by_growth> is True, leaves are sized by how much they changed, and
+    the leaves that did not change are left out, as are the folders left
+    with nothing in them; otherwise leaves are sized by their new size.
+    """
+    # Maps a depth to the trees at that depth whose parent is not built yet.
+    pending = {}
+    for path, old_size, new_size, is_folder in changes:
+        depth = len(path)
+        subtrees = pending.pop(depth + 1, []) if is_folder else []
+        if by_growth and old_size == new_size and not subtrees and path:
+            continue
+        name = path[-1] if path else root
+        pending.setdefault(depth, []).append(
+            DiffTree(name, old_size, new_size, subtrees, by_growth))
+    if 0 not in pending:
+        return None
+    return pending[0][0]
+
+
+def diff_trees(old: AbstractTree, new: AbstractTree,
+               by_growth: bool = True) -> Optional[DiffTree]:
+    """Return the DiffTree between the trees <old> and <new>.
+
+    The root of the result has the name of the root of <new>.
+    """
+    changes = diff_entries(iter_tree_entries(old), iter_tree_entries(new))
+    return build_diff_tree(changes, new._root, by_growth)
+
+
+def diff_paths(old_path: str, new_path: str,
+               by_growth: bool = True) -> Optional[DiffTree]:
+    """Return the DiffTree between the files or folders at <old_path> and
+    <new_path>, reading both straight from the disk.
+
+    Precondition: <old_path> and <new_path> are valid paths for this
+    computer.
+    """
+    changes = diff_entries(iter_disk_entries(old_path),
+                           iter_disk_entries(new_path))
+    return build_diff_tree(changes, os.path.basename(new_path), by_growth)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['os', 'tree_data']})
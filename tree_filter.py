@@ -0,0 +1,309 @@
+"""Treemap: Filtered Views
+
+=== Module Description ===
+This module contains filtered views of an existing tree, e.g. "only the *.log
+files" or "only the files not modified for 90 days", which can be shown in
+the treemap visualiser without scanning the file system again.
+
+A filter is a predicate: a function that takes a leaf of the tree and
+returns True if the leaf should be kept. A view of a tree for a predicate is
+a FilteredTree with the same shape as the tree, minus the leaves rejected by
+the predicate and the folders left with no leaves. Views are built in a
+single post-order pass when first needed, and FilteredViews keeps one per
+predicate. When a leaf of the tree is resized or deleted, FilteredViews
+updates the sizes of the views along the path from that leaf to their root,
+and only drops a view if the leaf is now kept by its predicate and was not
+before, or the other way around.
+
+A view can also group the leaves by file type instead of by folder: see
+build_type_tree.
+"""
+
+from __future__ import annotations
+import fnmatch
+import os
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tree_data import AbstractTree
+from type_index import NO_EXTENSION, extension_of
+
+# A filter: returns True for the leaves to keep.
+Predicate = Callable[[AbstractTree], bool]
+
+# The name of the group of files with no extension, in views by type.
+NO_EXTENSION_NAME = '(none)'
+
+
+class FilteredTree(AbstractTree):
+    """A node of a filtered view of another tree.
+
+    Its root, colour and separator are the ones of the node it stands for,
+    and its data_size is the total size of the leaves kept below it.
+
+    === Public Attributes ===
+    source: the node of the original tree this node stands for.
+    """
+    source: AbstractTree
+
+    def __init__(self: FilteredTree, source: AbstractTree,
+                 subtrees: List[FilteredTree], data_size: int = 0) -> None:
+        """Initialize a new FilteredTree standing for <source>.
+
+        As with the AbstractTree constructor, <data_size> is only used if
+        <subtrees> is empty, and the _parent_tree of every subtree is set to
+        self. Unlike it, no random colour is chosen, since the colour is the
+        one of <source>.
+        """
+        self._root = source._root
+        self._subtrees = subtrees
+        self._parent_tree = None
+        self.colour = source.colour
+        self.source = source
+        if not subtrees:
+            self.data_size = data_size
+            return
+        self.data_size = 0
+        for child_tree in subtrees:
+            self.data_size += child_tree.data_size
+            child_tree._parent_tree = self
+
+    def get_separator(self: FilteredTree) -> str:
+        """Return the string used to separate nodes in the string
+        representation of a path from the tree root to a leaf."""
+        return self.source.get_separator()
+
+
+def build_filtered_tree(tree: AbstractTree,
+                        predicate: Predicate) -> Optional[FilteredTree]:
+    """Return the view of <tree> keeping only the leaves for which
+    <predicate> is True, or None if there are no such leaves.
+    """
+    if not tree._subtrees:
+        if tree.is_empty() or not predicate(tree):
+            return None
+        return FilteredTree(tree, [], tree.data_size)
+
+    subtrees = []
+    for child_tree in tree._subtrees:
+        view = build_filtered_tree(child_tree, predicate)
+        if view is not None:
+            subtrees.append(view)
+    if not subtrees:
+        return None
+    return FilteredTree(tree, subtrees)
+
+
+class GroupTree(AbstractTree):
+    """A node grouping leaves of another tree, in a view by file type."""
+
+    def get_separator(self: AbstractTree) -> str:
+        """Return the string used to separate nodes in the string
+        representation of a path from the tree root to a leaf."""
+        return '/'
+
+
+def build_type_tree(tree: AbstractTree) -> GroupTree:
+    """Return a view of the leaves of <tree> grouped by extension.
+
+    The root has one subtree per extension, largest first, whose leaves are
+    FilteredTrees standing for the leaves of the original tree with that
+    extension, all drawn in the same colour.
+    """
+    groups = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.is_empty():
+            continue
+        if node._subtrees:
+            stack.extend(reversed(node._subtrees))
+            continue
+        source = node.source if isinstance(node, FilteredTree) else node
+        extension = extension_of(node._root)
+        leaf = FilteredTree(source, [], node.data_size)
+        leaf.colour = type_colour(extension)
+        groups.setdefault(extension, []).append(leaf)
+
+    subtrees = []
+    for extension, leaves in groups.items():
+        subtrees.append(GroupTree(extension or NO_EXTENSION_NAME, leaves))
+    subtrees.sort(key=lambda t: t.data_size, reverse=True)
+    return GroupTree(tree._root, subtrees)
+
+
+def type_colour(extension: str) -> Tuple[int, int, int]:
+    """Return the colour of the files with the given <extension>, which is
+    the same every time the program runs.
+    """
+    if extension == NO_EXTENSION:
+        return 128, 128, 128
+    code = zlib.crc32(extension.encode())
+    return code & 255, (code >> 8) & 255, (code >> 16) & 255
+
+
+class FilteredViews:
+    """The filtered views of a tree, built when first asked for.
+
+    === Private Attributes ===
+    _tree: the tree being filtered.
+    _views: maps each predicate (or None, for no filter) and whether the view
+        is grouped by type to the view of _tree for them.
+    _leaves: maps the same keys as _views to a dict mapping id(leaf) to the
+        FilteredTree standing for it in the view, for each leaf of _tree
+        kept in the view.
+    """
+    _tree: AbstractTree
+    _views: Dict[Tuple[Optional[Predicate], bool], AbstractTree]
+    _leaves: Dict[Tuple[Optional[Predicate], bool], Dict[int, FilteredTree]]
+
+    def __init__(self, tree: AbstractTree) -> None:
+        """Initialize the views of <tree>, with none built yet."""
+        self._tree = tree
+        self._views = {}
+        self._leaves = {}
+
+    def get_view(self, predicate: Optional[Predicate],
+                 by_type: bool = False) -> AbstractTree:
+        """Return the view of the tree for <predicate>, or of the whole tree
+        if <predicate> is None, grouped by type if <by_type> is True.
+
+        If no leaf is kept, the view is a single node of size 0.
+        """
+        if predicate is None and not by_type:
+            return self._tree
+        key = (predicate, by_type)
+        view = self._views.get(key)
+        if view is None:
+            if by_type:
+                view = build_type_tree(self.get_view(predicate))
+                kept = predicate is None or \
+                    bool(self._leaves[(predicate, False)])
+            else:
+                view = build_filtered_tree(self._tree, predicate)
+                kept = view is not None
+                if view is None:
+                    view = FilteredTree(self._tree, [], 0)
+            self._views[key] = view
+            self._leaves[key] = _leaves_by_source(view) if kept else {}
+        return view
+
+    def resize(self, leaf: AbstractTree, old_size: int,
+               new_size: int) -> None:
+        """Record that the data_size of <leaf> went from <old_size> to
+        <new_size>.
+        """
+        for key in list(self._views):
+            predicate = key[0]
+            view_leaf = self._leaves[key].get(id(leaf))
+            kept = predicate is None or predicate(leaf)
+            if kept != (view_leaf is not None):
+                # The leaf must be added to or removed from the view.
+                del self._views[key]
+                del self._leaves[key]
+            elif view_leaf is not None:
+                node = view_leaf
+                while node is not None:
+                    node.data_size += new_size - old_size
+                    node = node._parent_tree
+
+    def remove(self, leaf: AbstractTree) -> None:
+        """Record that <leaf> is about to be deleted from the tree."""
+        for key, view in self._views.items():
+            view_leaf = self._leaves[key].pop(id(leaf), None)
+            if view_leaf is None:
+                continue
+            data_size = view_leaf.data_size
+            node = view_leaf
+            while node is not None:
+                node.data_size -= data_size
+                node = node._parent_tree
+            # Remove the leaf, and the nodes left with nothing in them.
+            node = view_leaf
+            while node is not view and not node._subtrees:
+                parent = node._parent_tree
+                # Trees compare equal by name, so the node is found by
+                # identity; leaves of different folders can share a group.
+                del parent._subtrees[next(
+                    i for i, child in enumerate(parent._subtrees)
+                    if child is node)]
+                node._parent_tree = None
+                node = parent
+
+    def clear(self) -> None:
+        """Forget all views, so that they are built again from the tree."""
+        self._views.clear()
+        self._leaves.clear()
+
+
+def _leaves_by_source(view: AbstractTree) -> Dict[int, FilteredTree]:
+    """Return a dict mapping id(leaf) to the FilteredTree standing for leaf
+    in <view>, for each leaf of the original tree in <view>.
+    """
+    leaves = {}
+    stack = [view]
+    while stack:
+        node = stack.pop()
+        if node._subtrees:
+            stack.extend(node._subtrees)
+        elif isinstance(node, FilteredTree):
+            leaves[id(node.source)] = node
+    return leaves
+
+
+def name_matches(*patterns: str) -> Predicate:
+    """Return a predicate keeping the leaves whose name matches any of the
+    shell-style <patterns>, e.g. '*.log'.
+    """
+    def predicate(leaf: AbstractTree) -> bool:
+        """Return True if the name of <leaf> matches one of the patterns."""
+        name = str(leaf._root)
+        return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+    return predicate
+
+
+def larger_than(data_size: int) -> Predicate:
+    """Return a predicate keeping the leaves with a data_size greater than
+    <data_size>.
+    """
+    def predicate(leaf: AbstractTree) -> bool:
+        """Return True if <leaf> is large enough."""
+        return leaf.data_size > data_size
+    return predicate
+
+
+def modified_before(path: str, days: float) -> Predicate:
+    """Return a predicate keeping the leaves of the FileSystemTree for
+    <path> that were last modified more than <days> days ago.
+
+    Precondition: the tree being filtered was scanned from <path>.
+    """
+    cutoff = time.time() - days * 24 * 60 * 60
+    parent = os.path.dirname(os.path.abspath(path))
+
+    def predicate(leaf: AbstractTree) -> bool:
+        """Return True if the file for <leaf> is old enough."""
+        return os.path.getmtime(os.path.join(parent, *_path_names(leaf))) \
+            < cutoff
+    return predicate
+
+
+def _path_names(tree: AbstractTree) -> List[str]:
+    """Return the names of the nodes from the root of the whole tree down to
+    <tree>.
+    """
+    names = []
+    while tree is not None:
+        names.append(str(tree._root))
+        tree = tree._parent_tree
+    names.reverse()
+    return names
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['fnmatch', 'os', 'time', 'zlib', 'tree_data',
+                              'type_index']})
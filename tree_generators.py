@@ -0,0 +1,142 @@
+"""Treemap: Synthetic Tree Generators
+
+=== Module Description ===
+This module contains generators for synthetic trees, used by the benchmarks
+in benchmark_test.py.
+
+Each generator returns a record in the format used by the scanner module:
+(name, data_size, children), where children is None for a leaf. A record can
+be turned into an in-memory tree with build_synthetic_tree (or into a
+FileSystemTree with scanner.build_tree), or written to disk with
+write_record so that the scanners have something to scan.
+"""
+
+from __future__ import annotations
+import os
+import random
+from typing import List, Optional
+
+from tree_data import AbstractTree
+from scanner import Record
+
+
+class SyntheticTree(AbstractTree):
+    """A tree built from a generated record, rather than from real data."""
+
+    def get_separator(self: AbstractTree) -> str:
+        """Return the string used to separate nodes in the string
+        representation of a path from the tree root to a leaf."""
+        return '/'
+
+
+def wide_record(leaves: int, size: int = 1024) -> Record:
+    """Return a record with <leaves> leaves of <size> bytes directly under the
+    root.
+    """
+    return 'wide', 0, [('f{}'.format(i), size, None) for i in range(leaves)]
+
+
+def deep_record(depth: int, size: int = 1024) -> Record:
+    """Return a record that is a chain of <depth> folders, each containing a
+    leaf of <size> bytes and the next folder.
+    """
+    record = ('d{}'.format(depth), 0, [('f', size, None)])
+    for level in range(depth - 1, 0, -1):
+        record = ('d{}'.format(level), 0, [('f', size, None), record])
+    return record
+
+
+def balanced_record(fanout: int, depth: int, size: int = 1024) -> Record:
+    """Return a record in which every folder has <fanout> children, and all
+    leaves, of <size> bytes each, are <depth> levels below the root.
+    """
+    if depth == 0:
+        return 'f', size, None
+    children = []
+    for i in range(fanout):
+        name, data_size, subtrees = balanced_record(fanout, depth - 1, size)
+        children.append((name + str(i), data_size, subtrees))
+    return 'd', 0, children
+
+
+def zipf_record(leaves: int, fanout: int = 16, exponent: float = 1.2,
+                seed: int = 148) -> Record:
+    """Return a record with <leaves> leaves whose sizes follow a Zipf
+    distribution with the given <exponent>, grouped into folders of at most
+    <fanout> children.
+
+    The same <seed> always produces the same record.
+
+    Precondition: leaves >= 1
+    """
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(leaves):
+        rank = rng.randint(1, leaves)
+        size = max(1, int(2 ** 30 / rank ** exponent))
+        nodes.append(('f{}'.format(i), size, None))
+    return _group(nodes, fanout)
+
+
+def _group(nodes: List[Record], fanout: int) -> Record:
+    """Return a record whose leaves are <nodes>, grouping them into folders of
+    at most <fanout> children until a single root remains.
+    """
+    level = 0
+    while len(nodes) > 1 or nodes[0][2] is None:
+        nodes = [('d{}_{}'.format(level, i), 0, nodes[i:i + fanout])
+                 for i in range(0, len(nodes), fanout)]
+        level += 1
+    return nodes[0]
+
+
+def count_nodes(record: Record) -> int:
+    """Return the number of nodes in <record>."""
+    _, _, children = record
+    if children is None:
+        return 1
+    return 1 + sum(count_nodes(child) for child in children)
+
+
+def build_synthetic_tree(record: Record) -> SyntheticTree:
+    """Return the SyntheticTree described by <record>."""
+    name, data_size, children = record
+    if children is None:
+        return SyntheticTree(name, [], data_size)
+    return SyntheticTree(name, [build_synthetic_tree(child)
+                                for child in children])
+
+
+def write_record(record: Record, parent: str) -> str:
+    """Create the files and folders described by <record> inside the folder
+    <parent>, and return the path of the created root.
+
+    Files are created sparse, so their apparent size (as reported by
+    os.path.getsize) is their data_size but they take almost no space.
+    """
+    name, data_size, children = record
+    path = os.path.join(parent, name)
+    if children is None:
+        with open(path, 'wb') as f:
+            f.truncate(data_size)
+    else:
+        os.mkdir(path)
+        for child in children:
+            write_record(child, path)
+    return path
+
+
+def tmpfs_dir() -> Optional[str]:
+    """Return the path of a memory-backed folder to hold on-disk fixtures, or
+    None if this computer does not have one.
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['os', 'random', 'tree_data', 'scanner']})
@@ -0,0 +1,195 @@
+"""Treemap: Exporting and Importing Trees
+
+=== Module Description ===
+This module contains functions to save any AbstractTree to a text file and
+to load it back as a FileSystemTree, so that a tree can be scanned on one
+computer and visualised on another.
+
+Two formats are supported:
+  - NDJSON: one JSON object per line, in depth-first order (every node comes
+    before its subtrees), e.g.
+        {"depth": 0, "name": "B", "size": 40, "folder": true}
+        {"depth": 1, "name": "A", "size": 30, "folder": true}
+        {"depth": 2, "name": "f1.txt", "size": 15, "folder": false}
+  - du: the output format of `du -ab`, i.e. one "<size><TAB><path>" line per
+    node, with every folder coming after its contents.
+
+The writers produce the lines one at a time from a generator, and the readers
+consume them one at a time, keeping only a stack of the folders that are
+still open. Neither holds more than one path from the root to a leaf,
+besides the tree itself.
+"""
+
+from __future__ import annotations
+import json
+from itertools import chain
+from typing import Iterable, Iterator, List, Optional, TextIO
+
+from tree_data import AbstractTree, FileSystemTree
+from scanner import make_node
+from tree_diff import DiffTree, Entry, build_diff_tree, diff_entries
+
+# The separator used in the paths of the du format.
+DU_SEPARATOR = '/'
+
+# The file name suffix of trees saved as NDJSON.
+NDJSON_SUFFIX = '.ndjson'
+
+
+def iter_ndjson(tree: AbstractTree, sort: bool = True) -> Iterator[str]:
+    """Yield the NDJSON lines representing <tree>, each ending in a newline.
+
+    If <sort> is True, the subtrees of every node are written in order of
+    their names, as needed by read_entries; otherwise they are written in
+    their order in the tree.
+    """
+    stack = [(0, tree)]
+    while stack:
+        depth, node = stack.pop()
+        if node.is_empty():
+            continue
+        yield json.dumps({'depth': depth, 'name': str(node._root),
+                          'size': node.data_size,
+                          'folder': bool(node._subtrees)}) + '\n'
+        children = node._subtrees
+        if sort:
+            children = sorted(children, key=lambda t: str(t._root))
+        stack.extend((depth + 1, child) for child in reversed(children))
+
+
+def write_ndjson(tree: AbstractTree, f: TextIO, sort: bool = True) -> None:
+    """Write <tree> to the open file <f> as NDJSON.
+
+    If <sort> is True, the subtrees of every node are written in order of
+    their names.
+    """
+    f.writelines(iter_ndjson(tree, sort))
+
+
+def read_ndjson(lines: Iterable[str]) -> Optional[FileSystemTree]:
+    """Return the FileSystemTree represented by the NDJSON <lines>, e.g. an
+    open file written by write_ndjson, or None if there are no lines.
+    """
+    # The nodes that may still get subtrees: [name, data_size, subtrees].
+    open_nodes = []
+    tree = None
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        while len(open_nodes) > item['depth']:
+            tree = _close_node(open_nodes)
+        data_size = 0 if item['folder'] else item['size']
+        open_nodes.append([item['name'], data_size, []])
+    while open_nodes:
+        tree = _close_node(open_nodes)
+    return tree
+
+
+def read_entries(lines: Iterable[str]) -> Iterator[Entry]:
+    """Yield the tree_diff entries of the NDJSON <lines>, without building a
+    tree.
+
+    Raise ValueError if the subtrees of a node are not in order of their
+    names, i.e. if <lines> were written with sort=False.
+    """
+    names = []
+    last_path = None
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        del names[item['depth']:]
+        names.append(item['name'])
+        path = tuple(names[1:])
+        if last_path is not None and path <= last_path:
+            raise ValueError('NDJSON tree is not sorted at: '
+                             + DU_SEPARATOR.join(names))
+        last_path = path
+        size = 0 if item['folder'] else item['size']
+        yield path, size, item['folder']
+
+
+def diff_ndjson(old_path: str, new_path: str,
+                by_growth: bool = True) -> Optional[DiffTree]:
+    """Return the DiffTree between the trees saved in the NDJSON files at
+    <old_path> and <new_path>, streaming both files.
+
+    The root of the result has the name of the root saved in <new_path>.
+
+    Raise ValueError if either file was written with sort=False.
+    """
+    with open(old_path) as old_file, open(new_path) as new_file:
+        first = new_file.readline()
+        root = json.loads(first)['name'] if first.strip() else None
+        changes = diff_entries(read_entries(old_file),
+                               read_entries(chain([first], new_file)))
+        return build_diff_tree(changes, root, by_growth)
+
+
+def iter_du(tree: AbstractTree) -> Iterator[str]:
+    """Yield the lines of `du -ab` output representing <tree>, each ending in
+    a newline.
+    """
+    # Each node is pushed once to be expanded, then once more to be written
+    # after everything inside it.
+    stack = [(str(tree._root), tree, False)]
+    while stack:
+        path, node, expanded = stack.pop()
+        if node.is_empty():
+            continue
+        if expanded or not node._subtrees:
+            yield '{}\t{}\n'.format(node.data_size, path)
+            continue
+        stack.append((path, node, True))
+        stack.extend((path + DU_SEPARATOR + str(child._root), child, False)
+                     for child in reversed(node._subtrees))
+
+
+def write_du(tree: AbstractTree, f: TextIO) -> None:
+    """Write <tree> to the open file <f> in the format of `du -ab`."""
+    f.writelines(iter_du(tree))
+
+
+def read_du(lines: Iterable[str]) -> Optional[FileSystemTree]:
+    """Return the FileSystemTree represented by the `du -ab` output <lines>,
+    or None if there are no lines.
+
+    The data_size of a folder is the total size of the files in it, so it
+    does not include the size du gives the folder itself. Since du does not
+    tell files and folders apart, an empty folder is read as a file of the
+    size du gives it: 0 in the output of iter_du, but the size of a folder on
+    the disk (e.g. 4096 bytes) in real `du -ab` output.
+    """
+    # Maps a depth to the trees at that depth whose parent is not read yet.
+    pending = {}
+    tree = None
+    for line in lines:
+        if not line.strip():
+            continue
+        size, path = line.rstrip('\r\n').split('\t', 1)
+        names = path.rstrip(DU_SEPARATOR).split(DU_SEPARATOR)
+        depth = len(names)
+        tree = make_node(names[-1], pending.pop(depth + 1, []), int(size))
+        pending.setdefault(depth, []).append(tree)
+    return tree
+
+
+def _close_node(open_nodes: List[list]) -> FileSystemTree:
+    """Remove the innermost node from <open_nodes>, add it to the subtrees of
+    its parent, and return it.
+    """
+    name, data_size, subtrees = open_nodes.pop()
+    tree = make_node(name, subtrees, data_size)
+    if open_nodes:
+        open_nodes[-1][2].append(tree)
+    return tree
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['diff_ndjson'],
+            'extra-imports': ['json', 'itertools', 'tree_data', 'scanner',
+                              'tree_diff']})
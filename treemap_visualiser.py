@@ -12,9 +12,20 @@ concrete subclass, of course), rendering it to the user using pygame,
 and detecting user events like mouse clicks and key presses and responding
 to them.
 """
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
 import pygame
+import instrumentation
 from tree_data import FileSystemTree, AbstractTree
 from population import PopulationTree
+from scanner import scan_disk_usage, scan_parallel
+from async_scanner import AsyncScanner
+from tree_diff import diff_paths
+from tree_io import NDJSON_SUFFIX, diff_ndjson, read_du, read_ndjson
+from tree_filter import FilteredTree, FilteredViews, Predicate
+from type_index import TypeIndex, index_tree, scan_indexed
+from shared_tree import SharedTree, attach_tree
 
 
 # Screen dimensions and coordinates
@@ -28,38 +39,124 @@ TREEMAP_HEIGHT = HEIGHT - FONT_HEIGHT  # The height of the treemap display.
 # Font to use for the treemap program.
 FONT_FAMILY = 'Consolas'
 
-
-def run_visualisation(tree: AbstractTree) -> None:
-    """Display an interactive graphical display of the given tree's treemap."""
+# Two clicks closer together than DOUBLE_CLICK_MS (in milliseconds), and at
+# most DOUBLE_CLICK_DISTANCE pixels apart along each axis, are a double-click.
+DOUBLE_CLICK_MS = 400
+DOUBLE_CLICK_DISTANCE = 4
+
+# The number of subtree layouts remembered while zooming in and out.
+LAYOUT_CACHE_SIZE = 32
+
+# The ways run_treemap_file_system can scan a path, by name:
+#   - 'serial': one file system call at a time, in this process.
+#   - 'parallel': the top-level items of the path in separate processes.
+#   - 'disk_usage': files are sized by the disk space allocated to them, hard
+#     links are counted once and symbolic links are not followed.
+#   - 'network': many file system calls in flight at once, which is much
+#     faster on network file systems.
+SCANNERS = {
+    'serial': FileSystemTree,
+    'parallel': scan_parallel,
+    'disk_usage': scan_disk_usage,
+    'network': lambda path: AsyncScanner().scan(path),
+}
+
+
+class LayoutCache:
+    """The treemap rectangles of the most recently displayed subtrees.
+
+    Layouts are kept in least-recently-used order, and the oldest one is
+    dropped when there are more than <capacity>. Since trees cannot be
+    hashed, they are looked up by id; each tree is kept alongside its layout
+    so that its id cannot be reused while it is in the cache.
+
+    === Private Attributes ===
+    _capacity: the maximum number of layouts kept.
+    _layouts: maps id(tree) to the tree and its treemap rectangles.
+    """
+    _capacity: int
+    _layouts: OrderedDict
+
+    def __init__(self, capacity: int = LAYOUT_CACHE_SIZE) -> None:
+        """Initialize an empty cache holding at most <capacity> layouts."""
+        self._capacity = capacity
+        self._layouts = OrderedDict()
+
+    def get_layout(self, tree: AbstractTree) \
+            -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int]]]:
+        """Return the treemap of <tree> over the whole treemap display,
+        computing it only if it is not in the cache.
+        """
+        key = id(tree)
+        if key in self._layouts:
+            self._layouts.move_to_end(key)
+            return self._layouts[key][1]
+        layout = tree.generate_treemap((0, 0, WIDTH, TREEMAP_HEIGHT))
+        self._layouts[key] = (tree, layout)
+        if len(self._layouts) > self._capacity:
+            self._layouts.popitem(last=False)
+        return layout
+
+    def clear(self) -> None:
+        """Forget all layouts. This must be called whenever a data_size in
+        the tree changes.
+        """
+        self._layouts.clear()
+
+
+def run_visualisation(tree: AbstractTree,
+                      filters: Optional[List[Predicate]] = None,
+                      index: Optional[TypeIndex] = None) -> None:
+    """Display an interactive graphical display of the given tree's treemap.
+
+    The number keys 1 to 9 show the tree filtered by the corresponding
+    predicate in <filters>, and 0 shows the whole tree again. The T key
+    switches between grouping the leaves by folder and by file type.
+
+    If <index> is given, it is kept current as the tree changes.
+    """
     # Setup pygame
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
 
     # Render the initial display of the static treemap.
-    render_display(screen, tree, '')
+    cache = LayoutCache()
+    render_display(screen, tree, '', cache)
 
     # Start an event loop to respond to events.
-    event_loop(screen, tree)
+    event_loop(screen, tree, cache, filters, index)
 
 
 def render_display(screen: pygame.Surface, tree: AbstractTree,
-                   text: str) -> None:
+                   text: str, cache: Optional[LayoutCache] = None) -> None:
     """Render a treemap and text display to the given screen.
 
     Use the constants TREEMAP_HEIGHT and FONT_HEIGHT to divide the
     screen vertically into the treemap and text comments.
+
+    If <cache> is given, the treemap of <tree> is taken from it.
+
+    If instrumentation is enabled, the latest measurements are shown after
+    the text.
     """
-    # First, clear the screen
-    pygame.draw.rect(screen, pygame.color.THECOLORS['black'],
-                     (0, 0, WIDTH, HEIGHT))
-    info = tree.generate_treemap((0, 0, WIDTH, TREEMAP_HEIGHT))
+    if instrumentation.is_enabled():
+        text = (text + '  ' + instrumentation.overlay_text()).strip()
+
+    with instrumentation.timed('render'):
+        # First, clear the screen
+        pygame.draw.rect(screen, pygame.color.THECOLORS['black'],
+                         (0, 0, WIDTH, HEIGHT))
+        if cache is None:
+            info = tree.generate_treemap((0, 0, WIDTH, TREEMAP_HEIGHT))
+        else:
+            info = cache.get_layout(tree)
 
-    for data in info:
-        pygame.draw.rect(screen, data[1], data[0])
-        _render_text(screen, text)
+        for data in info:
+            pygame.draw.rect(screen, data[1], data[0])
+            _render_text(screen, text)
 
-    # This must be called *after* all other pygame functions have run.
-    pygame.display.flip()
+        # This must be called *after* all other pygame functions have run.
+        pygame.display.flip()
 
 
 def _render_text(screen: pygame.Surface, text: str) -> None:
@@ -73,20 +170,48 @@ def _render_text(screen: pygame.Surface, text: str) -> None:
     screen.blit(text_surface, text_pos)
 
 
-def event_loop(screen: pygame.Surface, tree: AbstractTree) -> None:
+def event_loop(screen: pygame.Surface, tree: AbstractTree,
+               cache: Optional[LayoutCache] = None,
+               filters: Optional[List[Predicate]] = None,
+               index: Optional[TypeIndex] = None) -> None:
     """Respond to events (mouse clicks, key presses) and update the display.
 
     Note that the event loop is an *infinite loop*: it continually waits for
     the next event, determines the event's type, and then updates the state
     of the visualisation or the tree itself, updating the display if necessary.
     This loop ends when the user closes the window.
+
+    Double-clicking zooms into the subtree under the mouse, one level down
+    from the subtree currently displayed, and backspace zooms back out. Only
+    the displayed subtree is laid out and searched for clicks.
+
+    The number key i (1 to 9) switches to the view of the tree filtered by
+    filters[i - 1], and 0 switches back to the whole tree. The T key groups
+    the leaves of the view by file type, or back by folder. Views are cached,
+    and updated in place when a leaf is resized or deleted.
+
+    If <index> is given, it is updated whenever a leaf is resized or deleted.
     """
+    if cache is None:
+        cache = LayoutCache()
+    if filters is None:
+        filters = []
     # We strongly recommend using a variable to keep track of the currently-
     # selected leaf (type AbstractTree | None).
     # But feel free to remove it, and/or add new variables, to help keep
     # track of the state of the program.
     selected_leaf = None
     size = 0
+    # The subtree currently displayed, and the ones displayed before it.
+    view = tree
+    zoom_stack = []
+    last_click = -DOUBLE_CLICK_MS
+    last_pos = (0, 0)
+    # The filter currently applied, if any, and whether leaves are grouped
+    # by type.
+    views = FilteredViews(tree)
+    predicate = None
+    by_type = False
 
     while True:
         event = pygame.event.poll()
@@ -96,7 +221,30 @@ def event_loop(screen: pygame.Surface, tree: AbstractTree) -> None:
         if event.type == pygame.MOUSEBUTTONDOWN:
             button = event.button
             rect = (ORIGIN[0], ORIGIN[1], WIDTH, TREEMAP_HEIGHT)
-            get_point = tree.get_info(rect, event.pos)
+            get_point = view.get_info(rect, event.pos)
+            if get_point is None or get_point.data_size == 0:
+                # Nothing is drawn there.
+                continue
+            now = pygame.time.get_ticks()
+            if button == 1 and _is_double_click(now - last_click,
+                                                last_pos, event.pos):
+                last_click = -DOUBLE_CLICK_MS
+                child = view.get_child_containing(get_point)
+                # get_info only returns leaves, so this skips zooming into
+                # a single leaf.
+                if child is not None and child is not get_point:
+                    zoom_stack.append(view)
+                    view = child
+                    selected_leaf = None
+                    size = 0
+                    render_display(screen, view, '', cache)
+                    continue
+            elif button == 1:
+                last_click = now
+                last_pos = event.pos
+            if isinstance(get_point, FilteredTree):
+                get_point = get_point.source
+
             if button == 1 and selected_leaf != get_point:
                 selected_leaf = get_point
                 size = selected_leaf.data_size
@@ -105,16 +253,48 @@ def event_loop(screen: pygame.Surface, tree: AbstractTree) -> None:
                 size = 0
 
             if button == 3:
+                if index is not None:
+                    index.remove(get_point)
+                views.remove(get_point)
                 tree.parent_remove(get_point)
                 tree.size_decrease(get_point)
+                cache.clear()
+                view, zoom_stack = _refresh_views(views, (predicate, by_type),
+                                                  view, zoom_stack)
             elif button == 3 and get_point == selected_leaf:
                 selected_leaf = None
-                render_display(screen, tree, '')
+                render_display(screen, view, '', cache)
+
+            text = tree.get_text(selected_leaf, size)
+            render_display(screen, view, text, cache)
+
+        if event.type == pygame.KEYDOWN and \
+                event.key == pygame.K_BACKSPACE and zoom_stack:
+            view = zoom_stack.pop()
+            text = tree.get_text(selected_leaf, size)
+            render_display(screen, view, text, cache)
+            continue
+
+        if event.type == pygame.KEYDOWN and filters and \
+                pygame.K_0 <= event.key <= pygame.K_0 + min(len(filters), 9):
+            number = event.key - pygame.K_0
+            predicate = filters[number - 1] if number else None
+            view = views.get_view(predicate, by_type)
+            zoom_stack = []
+            text = tree.get_text(selected_leaf, size)
+            render_display(screen, view, text, cache)
+            continue
 
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_t:
+            by_type = not by_type
+            view = views.get_view(predicate, by_type)
+            zoom_stack = []
             text = tree.get_text(selected_leaf, size)
-            render_display(screen, tree, text)
+            render_display(screen, view, text, cache)
+            continue
 
         if event.type == pygame.KEYDOWN and selected_leaf:
+            old_size = selected_leaf.data_size
             changes = tree.change_size(selected_leaf.data_size)
             if pygame.K_DOWN == event.key and selected_leaf.data_size - \
                     changes >= 1:
@@ -127,19 +307,156 @@ def event_loop(screen: pygame.Surface, tree: AbstractTree) -> None:
             if pygame.K_UP == event.key:
                 selected_leaf.data_size += changes
                 tree.increase_size(selected_leaf, changes)
+            if index is not None:
+                index.resize(selected_leaf, old_size, selected_leaf.data_size)
+            views.resize(selected_leaf, old_size, selected_leaf.data_size)
+            cache.clear()
+            view, zoom_stack = _refresh_views(views, (predicate, by_type),
+                                              view, zoom_stack)
             text = tree.get_text(selected_leaf, selected_leaf.data_size)
-            render_display(screen, tree, text)
+            render_display(screen, view, text, cache)
         # Remember to call render_display if any data_sizes change,
         # as the treemap will change in this case.
 
 
-def run_treemap_file_system(path: str) -> None:
-    """Run a treemap visualisation for the given path's file structure.
+def _is_double_click(interval: int, first_pos: Tuple[int, int],
+                     second_pos: Tuple[int, int]) -> bool:
+    """Return whether two clicks, <interval> milliseconds apart, at
+    <first_pos> and then <second_pos>, make a double-click.
+    """
+    return interval < DOUBLE_CLICK_MS and \
+        abs(second_pos[0] - first_pos[0]) <= DOUBLE_CLICK_DISTANCE and \
+        abs(second_pos[1] - first_pos[1]) <= DOUBLE_CLICK_DISTANCE
+
+
+def _refresh_views(views: FilteredViews,
+                   mode: Tuple[Optional[Predicate], bool], view: AbstractTree,
+                   zoom_stack: List[AbstractTree]) \
+        -> Tuple[AbstractTree, List[AbstractTree]]:
+    """Return the subtree to display and the zoom stack after the tree of
+    <views> changed, given the current <view> and <zoom_stack>, and the
+    predicate and grouping by type in <mode>.
+
+    If the change made <views> drop the view displayed, the display goes
+    back to the top of the view built in its place.
+    """
+    if mode == (None, False):
+        return view, zoom_stack
+    current = views.get_view(*mode)
+    if (zoom_stack[0] if zoom_stack else view) is current:
+        return view, zoom_stack
+    return current, []
+
+
+def run_treemap_file_system(path: str, scanner: str = 'serial',
+                            filters: Optional[List[Predicate]] = None,
+                            indexed: bool = False) -> None:
+    """Run a treemap visualisation for the given path's file structure,
+    scanned with the scanner called <scanner> in SCANNERS.
+
+    <filters> are the predicates the user can filter the tree by; see
+    tree_filter for some of them.
+
+    If <indexed> is True, a TypeIndex of the tree is built and kept current
+    while the tree is changed. The serial scanner builds it during the scan;
+    with the others, it is built from the scanned tree.
+
+    Raise ValueError if <scanner> is not in SCANNERS.
 
     Precondition: <path> is a valid path to a file or folder.
     """
-    file_tree = FileSystemTree(path)
-    run_visualisation(file_tree)
+    if scanner not in SCANNERS:
+        raise ValueError('unknown scanner: ' + scanner)
+    index = None
+    with instrumentation.timed('scan'):
+        if indexed and scanner == 'serial':
+            file_tree, index = scan_indexed(path)
+        else:
+            file_tree = SCANNERS[scanner](path)
+            if indexed:
+                index = index_tree(file_tree)
+    run_visualisation(file_tree, filters, index)
+
+
+def run_treemap_diff(old_path: str, new_path: str,
+                     by_growth: bool = True) -> None:
+    """Run a treemap visualisation of the changes between two snapshots of a
+    file structure, e.g. two backups of the same folder.
+
+    Leaves that grew are red and leaves that shrank are blue. If <by_growth>
+    is True, leaves are sized by how much they changed; otherwise, by their
+    new size.
+
+    If both paths end in NDJSON_SUFFIX, they are read as trees saved by
+    tree_io.write_ndjson (which must not have been given sort=False).
+
+    Precondition: <old_path> and <new_path> are valid paths to files or
+    folders.
+    """
+    with instrumentation.timed('scan'):
+        if old_path.endswith(NDJSON_SUFFIX) and \
+                new_path.endswith(NDJSON_SUFFIX):
+            diff_tree = diff_ndjson(old_path, new_path, by_growth)
+        else:
+            diff_tree = diff_paths(old_path, new_path, by_growth)
+    run_visualisation(diff_tree)
+
+
+def run_treemap_import(path: str) -> None:
+    """Run a treemap visualisation for a tree saved at <path>, e.g. by a scan
+    on another computer.
+
+    The file is read as NDJSON if <path> ends in NDJSON_SUFFIX, and as the
+    output of `du -ab` otherwise.
+
+    Precondition: <path> is a valid path to a file saved by tree_io.
+    """
+    with instrumentation.timed('scan'):
+        with open(path) as f:
+            if path.endswith(NDJSON_SUFFIX):
+                tree = read_ndjson(f)
+            else:
+                tree = read_du(f)
+    run_visualisation(tree)
+
+
+def run_treemap_shared(name: str) -> None:
+    """Run a treemap visualisation for a tree published by another process
+    with shared_tree.publish_tree in the shared memory segment <name>.
+
+    The tree is drawn straight from the shared memory, without copying it.
+    It is read-only: clicking a leaf shows its path and size, but leaves
+    cannot be resized or deleted.
+    """
+    tree = attach_tree(name)
+    try:
+        pygame.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        cache = LayoutCache()
+        render_display(screen, tree, '', cache)
+        _shared_event_loop(screen, tree, cache)
+    finally:
+        tree.close()
+
+
+def _shared_event_loop(screen: pygame.Surface, tree: SharedTree,
+                       cache: LayoutCache) -> None:
+    """Respond to clicks on the treemap of the shared <tree>, until the user
+    closes the window.
+    """
+    rect = (ORIGIN[0], ORIGIN[1], WIDTH, TREEMAP_HEIGHT)
+    while True:
+        event = pygame.event.poll()
+        if event.type == pygame.QUIT:
+            return
+
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            leaf = tree.get_info(rect, event.pos)
+            text = ''
+            if leaf is not None:
+                text = tree.get_path(leaf) + '     ' + \
+                    '(' + str(tree.sizes[leaf]) + ')'
+            render_display(screen, tree, text, cache)
 
 
 def run_treemap_population() -> None:
@@ -152,5 +469,10 @@ if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
         config={
-            'extra-imports': ['pygame', 'tree_data', 'population'],
+            'extra-imports': ['pygame', 'instrumentation', 'tree_data',
+                              'population', 'scanner', 'async_scanner',
+                              'tree_diff',
+                              'tree_io', 'tree_filter', 'type_index',
+                              'shared_tree'],
+            'allowed-io': ['run_treemap_import'],
             'generated-members': 'pygame.*'})
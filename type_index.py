@@ -0,0 +1,230 @@
+"""Treemap: File Type Index
+
+=== Module Description ===
+This module contains an index of the files of a tree by type, answering
+questions like "how much space do the .parquet files take, compared to the
+.log files?" without traversing the tree.
+
+For the whole tree and for every folder in it, a TypeIndex keeps the number
+of bytes and of files with each extension below that folder, and a histogram
+of the file sizes. scan_indexed builds the index while it scans, and
+index_tree builds it for a tree that already exists. Both count the leaves of
+the tree as its files, including the empty folders, which are leaves of size
+0 in the treemap too. The visualiser keeps the index current as the user
+resizes and deletes files.
+"""
+
+from __future__ import annotations
+import os
+from typing import Dict, List, Optional, Tuple
+
+from tree_data import AbstractTree, FileSystemTree
+from scanner import make_node
+
+# The extension of files that have none.
+NO_EXTENSION = ''
+
+
+def extension_of(name: object) -> str:
+    """Return the extension of the file called <name>, in lower case and
+    including the dot, or NO_EXTENSION if it has none.
+    """
+    return os.path.splitext(str(name))[1].lower()
+
+
+class TypeStats:
+    """The totals by extension for the files in some part of a tree.
+
+    === Public Attributes ===
+    bytes: maps each extension to the total size of the files with it.
+    files: maps each extension to the number of files with it.
+    buckets: maps i to the number of files of a size s with
+        2 ** (i - 1) <= s < 2 ** i (bucket 0 holds the empty files).
+
+    === Representation Invariants ===
+    - bytes and files have the same keys, and no value of files is 0.
+    - No value of buckets is 0.
+    """
+    bytes: Dict[str, int]
+    files: Dict[str, int]
+    buckets: Dict[int, int]
+
+    def __init__(self: TypeStats) -> None:
+        """Initialize totals for no files."""
+        self.bytes = {}
+        self.files = {}
+        self.buckets = {}
+
+    def add(self: TypeStats, extension: str, data_size: int,
+            count: int = 1) -> None:
+        """Add <count> files with the given <extension> and <data_size> to
+        these totals. A negative <count> removes them.
+        """
+        files = self.files.get(extension, 0) + count
+        if files:
+            self.files[extension] = files
+            self.bytes[extension] = \
+                self.bytes.get(extension, 0) + count * data_size
+        else:
+            del self.files[extension]
+            del self.bytes[extension]
+
+        bucket = data_size.bit_length()
+        in_bucket = self.buckets.get(bucket, 0) + count
+        if in_bucket:
+            self.buckets[bucket] = in_bucket
+        else:
+            del self.buckets[bucket]
+
+    def merge(self: TypeStats, other: TypeStats) -> None:
+        """Add all the files counted in <other> to these totals."""
+        for extension, files in other.files.items():
+            self.files[extension] = self.files.get(extension, 0) + files
+            self.bytes[extension] = \
+                self.bytes.get(extension, 0) + other.bytes[extension]
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    def largest(self: TypeStats) -> List[Tuple[str, int]]:
+        """Return the (extension, bytes) pairs, largest first."""
+        return sorted(self.bytes.items(), key=lambda item: (-item[1], item[0]))
+
+
+class TypeIndex:
+    """The TypeStats of a whole tree and of each of its folders.
+
+    === Public Attributes ===
+    total: the totals for the whole tree.
+
+    === Private Attributes ===
+    _folders: maps id(folder) to the folder and the totals for the files
+        below it. Each folder is kept so that its id cannot be reused.
+    """
+    total: TypeStats
+    _folders: Dict[int, Tuple[AbstractTree, TypeStats]]
+
+    def __init__(self: TypeIndex) -> None:
+        """Initialize an empty index."""
+        self.total = TypeStats()
+        self._folders = {}
+
+    def get_stats(self: TypeIndex,
+                  folder: AbstractTree) -> Optional[TypeStats]:
+        """Return the totals for the files below <folder>, or None if
+        <folder> is not a folder in the index.
+        """
+        entry = self._folders.get(id(folder))
+        if entry is None:
+            return None
+        return entry[1]
+
+    def add_folder(self: TypeIndex, folder: AbstractTree,
+                   stats: TypeStats) -> None:
+        """Record <stats> as the totals for the files below <folder>."""
+        self._folders[id(folder)] = (folder, stats)
+
+    def resize(self: TypeIndex, leaf: AbstractTree, old_size: int,
+               new_size: int) -> None:
+        """Record that the data_size of <leaf> went from <old_size> to
+        <new_size>.
+        """
+        extension = extension_of(leaf._root)
+        for stats in self._stats_above(leaf):
+            stats.add(extension, old_size, -1)
+            stats.add(extension, new_size)
+
+    def remove(self: TypeIndex, leaf: AbstractTree) -> None:
+        """Record that <leaf> is about to be deleted from the tree."""
+        extension = extension_of(leaf._root)
+        for stats in self._stats_above(leaf):
+            stats.add(extension, leaf.data_size, -1)
+
+    def _stats_above(self: TypeIndex,
+                     leaf: AbstractTree) -> List[TypeStats]:
+        """Return the totals that count <leaf>: the ones of each folder it is
+        in, and the total.
+
+        The totals of the root folder are usually the total itself, and are
+        only returned once.
+        """
+        found = [self.total]
+        folder = leaf._parent_tree
+        while folder is not None:
+            stats = self.get_stats(folder)
+            if stats is not None and stats is not self.total:
+                found.append(stats)
+            folder = folder._parent_tree
+        return found
+
+
+def scan_indexed(path: str) -> Tuple[FileSystemTree, TypeIndex]:
+    """Return the FileSystemTree for <path>, and its TypeIndex built during
+    the same walk of the disk.
+
+    The tree has the same shape and sizes as FileSystemTree(path).
+
+    Precondition: <path> is a valid path for this computer.
+    """
+    index = TypeIndex()
+    tree, stats = _scan_indexed(path, index)
+    index.total = stats
+    return tree, index
+
+
+def _scan_indexed(path: str,
+                  index: TypeIndex) -> Tuple[FileSystemTree, TypeStats]:
+    """Return the FileSystemTree for <path> and the totals for the files in
+    it, adding every folder to <index>.
+    """
+    name = os.path.basename(path)
+    stats = TypeStats()
+    if not os.path.isdir(path):
+        data_size = os.path.getsize(path)
+        stats.add(extension_of(name), data_size)
+        return make_node(name, [], data_size), stats
+
+    subtrees = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            subtree, child_stats = _scan_indexed(entry.path, index)
+            subtrees.append(subtree)
+            stats.merge(child_stats)
+    if not subtrees:
+        # An empty folder is a leaf, like a file.
+        stats.add(extension_of(name), 0)
+        return make_node(name, []), stats
+    tree = make_node(name, subtrees)
+    index.add_folder(tree, stats)
+    return tree, stats
+
+
+def index_tree(tree: AbstractTree) -> TypeIndex:
+    """Return the TypeIndex of <tree>, treating the nodes with no subtrees as
+    the files.
+    """
+    index = TypeIndex()
+    index.total = _index_node(tree, index)
+    return index
+
+
+def _index_node(tree: AbstractTree, index: TypeIndex) -> TypeStats:
+    """Return the totals for the files in <tree>, adding every folder in it
+    to <index>.
+    """
+    stats = TypeStats()
+    if tree.is_empty():
+        return stats
+    if not tree._subtrees:
+        stats.add(extension_of(tree._root), tree.data_size)
+        return stats
+    for child_tree in tree._subtrees:
+        stats.merge(_index_node(child_tree, index))
+    index.add_folder(tree, stats)
+    return stats
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['os', 'tree_data', 'scanner']})